@@ -22,6 +22,9 @@ participant_id_column = config.get("participant_id_column", "eid")
 try:
     hesin_data = load_csv(HESIN_DATA_PATH, required_columns=["eid", "diag_icd10"])
     hesin_data["diag_icd10"] = (hesin_data["diag_icd10"].astype(str).replace("nan", pd.NA))
+    # Store the codes as a categorical so each per-disease lookup factorizes integer codes
+    # and runs its string matching on the distinct codes only
+    hesin_data["diag_icd10"] = hesin_data["diag_icd10"].astype("category")
 
     all_participants = load_csv(PARTICIPANT_DATA_PATH)
 
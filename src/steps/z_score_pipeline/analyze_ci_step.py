@@ -197,6 +197,13 @@ def analyze_ci_step(connection_matrices, ci_matrices, output_base_dir, experimen
     return analysis_results
 
 
+def analyze_ci_step_from_config(experiment_name, step_config, connection_matrices, ci_matrices, default_output_base_dir=None):
+    """Run analyze_ci_step with the settings from the pipeline config's analyze_ci_step section."""
+    output_base_dir = step_config.get('OUTPUT_BASE_DIR', default_output_base_dir)
+    return analyze_ci_step(connection_matrices, ci_matrices, output_base_dir, experiment_name,
+                           step_config.get('UPPER_THRESHOLD', 3.0), step_config.get('LOWER_THRESHOLD', 3.0))
+
+
 if __name__ == '__main__':
     # Default configuration for direct execution
     print("This step should be called from the main pipeline with connection_matrices and ci_matrices as input.")
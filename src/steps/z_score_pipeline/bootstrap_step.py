@@ -156,3 +156,9 @@ def bootstrap_step(experiment_name, input_data_dir, output_base_dir, fields_to_k
     
     return all_shuffled_dfs
 
+
+def bootstrap_step_from_config(experiment_name, step_config, input_data_dir):
+    """Run bootstrap_step with the settings from the pipeline config's bootstrap_step section."""
+    return bootstrap_step(experiment_name, input_data_dir, step_config['OUTPUT_BASE_DIR'],
+                          step_config['FIELDS_TO_KEEP'], step_config['SHUFFLE_ITERATIONS'],
+                          step_config.get('SAVE_BOOTSTRAP_DATA', True))
@@ -175,6 +175,12 @@ def calculate_ci_step(connection_matrices, output_base_dir, experiment_name, z_a
     return ci_matrices
 
 
+def calculate_ci_step_from_config(experiment_name, step_config, connection_matrices, default_output_base_dir=None):
+    """Run calculate_ci_step with the settings from the pipeline config's calculate_ci_step section."""
+    output_base_dir = step_config.get('OUTPUT_BASE_DIR', default_output_base_dir)
+    return calculate_ci_step(connection_matrices, output_base_dir, experiment_name, step_config.get('Z_ALPHA', 1.96))
+
+
 if __name__ == '__main__':
     # Default configuration for direct execution
     print("This step should be called from the main pipeline with connection_matrices as input.")
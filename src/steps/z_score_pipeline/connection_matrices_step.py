@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-from itertools import combinations
+from scipy import sparse
 from tqdm import tqdm
 import os
 import glob
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 
 def process_disease_dataframe(df, verbose=False):
@@ -22,28 +23,23 @@ def process_disease_dataframe(df, verbose=False):
             - unique_eids: Number of unique participants
             - unique_diseases: List of unique disease codes
     """
-    # Make a copy to avoid SettingWithCopyWarning
-    df = df.copy()
-    
     # ------------------------------------------------------------------ #
     # 2. Remove duplicate eid-diag_icd10 pairs
     # ------------------------------------------------------------------ #
     if verbose:
         print(f"\n[Step 2/8] Checking for duplicate eid-diag_icd10 pairs...")
+    # Single hashing pass that also returns a new frame (so the caller's df is never
+    # modified); the duplicate count is the row-count delta
     initial_rows = len(df)
-    duplicate_count = df.duplicated(subset=['eid', 'diag_icd10']).sum()
+    df = df.drop_duplicates(subset=['eid', 'diag_icd10'], ignore_index=True)
+    duplicate_count = initial_rows - len(df)
     if verbose:
         print(f"  Found {duplicate_count:,} duplicate pairs")
-    if duplicate_count > 0:
-        if verbose:
-            print("  Removing duplicates...")
-        df = df.drop_duplicates(subset=['eid', 'diag_icd10']).copy()
-        removed = initial_rows - len(df)
-        if verbose:
-            print(f"  ✓ Removed {removed:,} duplicate rows")
+        if duplicate_count > 0:
+            print(f"  ✓ Removed {duplicate_count:,} duplicate rows")
             print(f"  ✓ Remaining rows: {len(df):,}")
-    elif verbose:
-        print("  ✓ No duplicates found")
+        else:
+            print("  ✓ No duplicates found")
     
     # ------------------------------------------------------------------ #
     # 3. Basic stats
@@ -62,7 +58,11 @@ def process_disease_dataframe(df, verbose=False):
     # ------------------------------------------------------------------ #
     if verbose:
         print(f"\n[Step 4/8] Simplifying ICD-10 codes...")
-    df['diag_icd10_simplified'] = df['diag_icd10'].str.split(r'[\.\s]').str[0]
+    # Extract the prefix once per distinct code and gather it back to rows
+    # (missing values are factorized to -1, which indexes the trailing NaN)
+    diag_codes, diag_uniques = pd.factorize(df['diag_icd10'])
+    simplified_uniques = pd.Series(diag_uniques, dtype=object).str.extract(r'^([^.\s]*)', expand=False)
+    df['diag_icd10_simplified'] = np.append(simplified_uniques.to_numpy(dtype=object), np.nan)[diag_codes]
     if verbose:
         print(f"  ✓ Simplified ICD-10 codes (extracted prefix before '.' or space)")
     
@@ -77,52 +77,57 @@ def process_disease_dataframe(df, verbose=False):
     removed_invalid = rows_before_clean - len(df)
     if verbose and removed_invalid > 0:
         print(f"  ✓ Removed {removed_invalid:,} rows with invalid/missing codes")
+    
+    # Different suffix codes can collapse to the same prefix; keep one row per patient/disease
+    rows_before_dedup = len(df)
+    df = df.drop_duplicates(subset=['eid', 'diag_icd10_simplified'], ignore_index=True)
+    if verbose:
+        print(f"  ✓ Collapsed {rows_before_dedup - len(df):,} rows sharing a simplified code per patient")
     if verbose:
         print(f"  ✓ Remaining rows after cleaning: {len(df):,}")
     
     # ------------------------------------------------------------------ #
     # 6. Group diseases per patient (for co-occurrence matrix)
     # ------------------------------------------------------------------ #
+    # The co-occurrence matrix is built from (eid, disease) pairs directly, so the
+    # per-patient grouping is only needed for the statistics below
     if verbose:
         print(f"\n[Step 6/8] Grouping diseases by patient...")
-    patient_diseases = (
-        df.groupby('eid')['diag_icd10_simplified']
-          .apply(list)
-          .reset_index()
-    )
-    if verbose:
-        print(f"  ✓ Grouped diseases for {len(patient_diseases):,} patients")
-        # Calculate some stats
-        disease_counts_per_patient = patient_diseases['diag_icd10_simplified'].apply(len)
-        print(f"  ✓ Average diseases per patient: {disease_counts_per_patient.mean():.2f}")
-        print(f"  ✓ Max diseases for a single patient: {disease_counts_per_patient.max()}")
-        print(f"  ✓ Patients with multiple diseases: {(disease_counts_per_patient > 1).sum():,}")
+        # Sort eids once and count the run length of each patient
+        _, disease_counts_per_patient = np.unique(df['eid'].to_numpy(), return_counts=True)
+        print(f"  ✓ Grouped diseases for {len(disease_counts_per_patient):,} patients")
+        if len(disease_counts_per_patient) > 0:
+            # Calculate some stats
+            print(f"  ✓ Average diseases per patient: {disease_counts_per_patient.mean():.2f}")
+            print(f"  ✓ Max diseases for a single patient: {disease_counts_per_patient.max()}")
+            print(f"  ✓ Patients with multiple diseases: {(disease_counts_per_patient > 1).sum():,}")
     
     # ------------------------------------------------------------------ #
     # 7. Build co-occurrence matrix
     # ------------------------------------------------------------------ #
     if verbose:
         print(f"\n[Step 7/8] Building co-occurrence matrix...")
-    unique_diseases = sorted(df['diag_icd10_simplified'].unique())
+    # Binary patient x disease incidence matrix (rows are distinct eid/disease pairs after step 5)
+    disease_idx, unique_diseases = pd.factorize(df['diag_icd10_simplified'], sort=True)
+    eid_idx, unique_pair_eids = pd.factorize(df['eid'])
+    unique_diseases = unique_diseases.tolist()
     matrix_size = len(unique_diseases)
-    scoring_matrix = np.zeros((matrix_size, matrix_size), dtype=int)
     
     if verbose:
         print(f"  Matrix size: {matrix_size:,} x {matrix_size:,} diseases")
         print(f"  Total possible pairs: {matrix_size * (matrix_size - 1) // 2:,}")
     
-    disease_to_index = {disease: idx for idx, disease in enumerate(unique_diseases)}
+    incidence = sparse.csr_matrix(
+        (np.ones(len(df), dtype=np.int32), (eid_idx, disease_idx)),
+        shape=(len(unique_pair_eids), matrix_size)
+    )
     
-    total_co_occurrences = 0
-    # Always show progress bar for co-occurrence processing (it's the slowest step)
-    for diseases in tqdm(patient_diseases['diag_icd10_simplified'],
-                         desc="  Co-occurrences",
-                         leave=False):
-        for d1, d2 in combinations(set(diseases), 2):
-            i1, i2 = disease_to_index[d1], disease_to_index[d2]
-            scoring_matrix[i1, i2] += 1
-            scoring_matrix[i2, i1] += 1
-            total_co_occurrences += 1
+    # Co-occurrence counts: number of patients sharing each pair of diseases.
+    # The product is already symmetric; int32 comfortably holds participant counts.
+    # The diagonal holds per-disease patient counts, which are not pairs.
+    scoring_matrix = (incidence.T @ incidence).toarray()
+    np.fill_diagonal(scoring_matrix, 0)
+    total_co_occurrences = int(scoring_matrix.sum()) // 2
     
     if verbose:
         # Calculate matrix statistics
@@ -141,6 +146,24 @@ def process_disease_dataframe(df, verbose=False):
     return scoring_df, unique_eids, unique_diseases
 
 
+def save_connection_matrix(scoring_df, output_matrix_path):
+    """
+    Save a connection matrix in the format given by the file extension.
+    
+    Args:
+        scoring_df: Connection matrix DataFrame (disease codes as index and columns)
+        output_matrix_path: Destination path. A '.npz' path writes a compressed NumPy
+                            archive with 'matrix' (int32 counts) and 'diseases' (labels);
+                            any other extension writes a labelled CSV.
+    """
+    if output_matrix_path.endswith('.npz'):
+        np.savez_compressed(output_matrix_path,
+                            matrix=scoring_df.to_numpy(dtype=np.int32),
+                            diseases=np.asarray(scoring_df.index, dtype=str))
+    else:
+        scoring_df.to_csv(output_matrix_path)
+
+
 def process_single_dataframe(df, output_matrix_path, dataset_name="dataset", verbose=False):
     """
     Process a DataFrame to create co-occurrence matrix.
@@ -148,7 +171,7 @@ def process_single_dataframe(df, output_matrix_path, dataset_name="dataset", ver
     
     Args:
         df: DataFrame with disease data
-        output_matrix_path: Path to save the disease connection matrix
+        output_matrix_path: Path to save the disease connection matrix (.csv or .npz)
         dataset_name: Name identifier for the dataset (for logging)
         verbose: If True, print detailed progress (default: False)
     
@@ -169,7 +192,7 @@ def process_single_dataframe(df, output_matrix_path, dataset_name="dataset", ver
     if verbose:
         print(f"\n[Step 8/8] Saving co-occurrence matrix...")
         print(f"  Saving to {output_matrix_path}...")
-    scoring_df.to_csv(output_matrix_path)
+    save_connection_matrix(scoring_df, output_matrix_path)
     if verbose:
         file_size_mb = os.path.getsize(output_matrix_path) / (1024 * 1024)
         print(f"  ✓ Disease connection matrix saved successfully")
@@ -195,13 +218,17 @@ def process_single_file(input_file_path, output_matrix_path):
     Args:
         input_file_path: Path to a single input CSV file with disease data
         output_matrix_path: Path to save the disease connection matrix
+    
+    Returns:
+        pd.DataFrame: The connection matrix (scoring_df)
     """
-    df = pd.read_csv(input_file_path)
+    # Only eid and diag_icd10 feed the co-occurrence matrix
+    df = pd.read_csv(input_file_path, usecols=['eid', 'diag_icd10'])
     dataset_name = os.path.basename(input_file_path)
-    process_single_dataframe(df, output_matrix_path, dataset_name)
+    return process_single_dataframe(df, output_matrix_path, dataset_name)
 
 
-def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, experiment_name, shuffle_iterations):
+def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, experiment_name, shuffle_iterations, matrix_format='csv', max_workers=None):
     """
     Process original and shuffled DataFrames to create co-occurrence matrices.
     
@@ -211,6 +238,10 @@ def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, e
         output_base_dir: Base directory for saving outputs
         experiment_name: Experiment name to append to output directory
         shuffle_iterations: Number of bootstrap iterations (for organizing output)
+        matrix_format: File format for saved matrices, 'csv' (default) or 'npz'
+                       (compressed NumPy archive, much smaller and faster to write)
+        max_workers: Number of worker processes building matrices in parallel
+                     (default: None, one per CPU)
     
     Returns:
         dict: Dictionary mapping matrix names to connection matrix DataFrames
@@ -223,6 +254,11 @@ def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, e
     print(f"Original data directory: {original_data_dir}")
     print(f"Output base directory: {output_base_dir}")
     print(f"Number of shuffled DataFrames: {len(shuffled_dfs)}")
+    print(f"Matrix format: {matrix_format}")
+    print(f"Max workers: {max_workers or os.cpu_count()}")
+    
+    if matrix_format not in ('csv', 'npz'):
+        raise ValueError(f"Unknown matrix_format '{matrix_format}', expected 'csv' or 'npz'")
     
     # Set working directory to src (parent of steps directory)
     # File is at: src/steps/z_score_pipeline/connection_matrices_step.py
@@ -251,93 +287,95 @@ def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, e
     total_processed = 0
     all_connection_matrices = {}  # Dictionary to store all connection matrices
     
-    # ------------------------------------------------------------------ #
-    # Process original DataFrames
-    # ------------------------------------------------------------------ #
-    print(f"\n[Step 1/2] Processing original DataFrames...")
-    original_csv_files = glob.glob(os.path.join(original_data_dir, "*.csv"))
-    
-    if not original_csv_files:
-        print(f"  ⚠ Warning: No CSV files found in {original_data_dir}")
-    else:
-        print(f"  ✓ Found {len(original_csv_files):,} original file(s)")
-        
-        # Store original DataFrames and their names for later reference
-        original_dataframes = {}
-        
-        # Process original files with progress bar
-        for csv_file in tqdm(original_csv_files, desc="Processing original matrices"):
-            file_name = os.path.basename(csv_file)
-            base_name = os.path.splitext(file_name)[0]  # Remove .csv extension
-            
-            # Remove "_filtered" suffix if present for cleaner names
-            if base_name.endswith('_filtered'):
-                base_name = base_name[:-9]  # Remove "_filtered"
-            
-            df = pd.read_csv(csv_file)
-            original_dataframes[base_name] = df
-            
-            # Create output path
-            output_matrix_file = f"{base_name}_disease_connection_matrix.csv"
-            output_matrix_path = os.path.join(original_output_dir, output_matrix_file)
-            
-            # Process and save (quiet mode), and capture the returned matrix
-            connection_matrix = process_single_dataframe(df, output_matrix_path, f"original_{base_name}", verbose=False)
-            all_connection_matrices[f"original_{base_name}"] = connection_matrix
-            total_processed += 1
-    
-    # ------------------------------------------------------------------ #
-    # Process shuffled DataFrames
-    # ------------------------------------------------------------------ #
-    print(f"\n[Step 2/2] Processing shuffled DataFrames...")
-    
-    if not shuffled_dfs:
-        print(f"  ⚠ Warning: No shuffled DataFrames provided")
-    else:
-        print(f"  ✓ Processing {len(shuffled_dfs):,} shuffled DataFrame(s)")
+    # Every dataset is independent, so matrices are built in a pool of worker processes
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # ------------------------------------------------------------------ #
+        # Process original DataFrames
+        # ------------------------------------------------------------------ #
+        print(f"\n[Step 1/2] Processing original DataFrames...")
+        original_csv_files = glob.glob(os.path.join(original_data_dir, "*.csv"))
         
-        # Group shuffled DataFrames by their source type
-        # We need to infer the type from the order: first N are from first file, next N from second file, etc.
-        if original_csv_files:
-            num_original_files = len(original_csv_files)
-            dfs_per_file = len(shuffled_dfs) // num_original_files
+        if not original_csv_files:
+            print(f"  ⚠ Warning: No CSV files found in {original_data_dir}")
+        else:
+            print(f"  ✓ Found {len(original_csv_files):,} original file(s)")
             
-            for file_idx, csv_file in enumerate(original_csv_files):
+            matrix_names = []
+            output_matrix_paths = []
+            for csv_file in original_csv_files:
                 file_name = os.path.basename(csv_file)
-                base_name = os.path.splitext(file_name)[0]
+                base_name = os.path.splitext(file_name)[0]  # Remove .csv extension
                 
-                # Remove "_filtered" suffix if present
+                # Remove "_filtered" suffix if present for cleaner names
                 if base_name.endswith('_filtered'):
-                    base_name = base_name[:-9]
+                    base_name = base_name[:-9]  # Remove "_filtered"
                 
-                # Create subdirectory for this bootstrap type
-                type_bootstrap_dir = os.path.join(bootstrap_output_dir, base_name)
-                os.makedirs(type_bootstrap_dir, exist_ok=True)
-                
-                # Get the shuffled DataFrames for this file
-                start_idx = file_idx * dfs_per_file
-                end_idx = start_idx + dfs_per_file
-                file_shuffled_dfs = shuffled_dfs[start_idx:end_idx]
-                
-                print(f"\n  Processing bootstrap matrices for: {base_name} ({len(file_shuffled_dfs):,} versions)")
+                # Create output path
+                output_matrix_file = f"{base_name}_disease_connection_matrix.{matrix_format}"
+                matrix_names.append(f"original_{base_name}")
+                output_matrix_paths.append(os.path.join(original_output_dir, output_matrix_file))
+            
+            # Load, process and save each file in a worker (quiet mode), and capture the returned matrices
+            connection_matrices = executor.map(process_single_file, original_csv_files, output_matrix_paths)
+            for matrix_name, connection_matrix in zip(matrix_names, tqdm(connection_matrices,
+                                                                          total=len(original_csv_files),
+                                                                          desc="Processing original matrices")):
+                all_connection_matrices[matrix_name] = connection_matrix
+                total_processed += 1
+        
+        # ------------------------------------------------------------------ #
+        # Process shuffled DataFrames
+        # ------------------------------------------------------------------ #
+        print(f"\n[Step 2/2] Processing shuffled DataFrames...")
+        
+        if not shuffled_dfs:
+            print(f"  ⚠ Warning: No shuffled DataFrames provided")
+        else:
+            print(f"  ✓ Processing {len(shuffled_dfs):,} shuffled DataFrame(s)")
+            
+            # Group shuffled DataFrames by their source type
+            # We need to infer the type from the order: first N are from first file, next N from second file, etc.
+            if original_csv_files:
+                num_original_files = len(original_csv_files)
+                dfs_per_file = len(shuffled_dfs) // num_original_files
                 
-                # Process each shuffled DataFrame with progress bar
-                for bootstrap_idx, df_shuffled in enumerate(tqdm(file_shuffled_dfs, 
-                                                                  desc=f"  {base_name} bootstrap",
-                                                                  leave=False), 1):
-                    output_matrix_file = f"{base_name}_bootstrap_{bootstrap_idx}_disease_connection_matrix.csv"
-                    output_matrix_path = os.path.join(type_bootstrap_dir, output_matrix_file)
+                for file_idx, csv_file in enumerate(original_csv_files):
+                    file_name = os.path.basename(csv_file)
+                    base_name = os.path.splitext(file_name)[0]
                     
-                    # Process and save (quiet mode), and capture the returned matrix
-                    connection_matrix = process_single_dataframe(
-                        df_shuffled, 
-                        output_matrix_path, 
-                        f"bootstrap_{base_name}_{bootstrap_idx}",
-                        verbose=False
-                    )
-                    all_connection_matrices[f"bootstrap_{base_name}_{bootstrap_idx}"] = connection_matrix
-                    total_processed += 1
-    
+                    # Remove "_filtered" suffix if present
+                    if base_name.endswith('_filtered'):
+                        base_name = base_name[:-9]
+                    
+                    # Create subdirectory for this bootstrap type
+                    type_bootstrap_dir = os.path.join(bootstrap_output_dir, base_name)
+                    os.makedirs(type_bootstrap_dir, exist_ok=True)
+                    
+                    # Get the shuffled DataFrames for this file
+                    start_idx = file_idx * dfs_per_file
+                    end_idx = start_idx + dfs_per_file
+                    file_shuffled_dfs = shuffled_dfs[start_idx:end_idx]
+                    
+                    print(f"\n  Processing bootstrap matrices for: {base_name} ({len(file_shuffled_dfs):,} versions)")
+                    
+                    bootstrap_indices = range(1, len(file_shuffled_dfs) + 1)
+                    output_matrix_paths = [
+                        os.path.join(type_bootstrap_dir,
+                                     f"{base_name}_bootstrap_{bootstrap_idx}_disease_connection_matrix.{matrix_format}")
+                        for bootstrap_idx in bootstrap_indices
+                    ]
+                    dataset_names = [f"bootstrap_{base_name}_{bootstrap_idx}" for bootstrap_idx in bootstrap_indices]
+                    
+                    # Process and save each shuffled DataFrame in a worker (quiet mode), and capture the returned matrices
+                    connection_matrices = executor.map(process_single_dataframe, file_shuffled_dfs,
+                                                       output_matrix_paths, dataset_names)
+                    for dataset_name, connection_matrix in zip(dataset_names, tqdm(connection_matrices,
+                                                                                   total=len(file_shuffled_dfs),
+                                                                                   desc=f"  {base_name} bootstrap",
+                                                                                   leave=False)):
+                        all_connection_matrices[dataset_name] = connection_matrix
+                        total_processed += 1
+        
     print("\n" + "="*70)
     print("Connection Matrices Step Completed Successfully!")
     print("="*70)
@@ -352,6 +390,12 @@ def connection_matrices_step(original_data_dir, shuffled_dfs, output_base_dir, e
     return all_connection_matrices
 
 
+def connection_matrices_step_from_config(experiment_name, step_config, original_data_dir, shuffled_dfs, shuffle_iterations):
+    """Run connection_matrices_step with the settings from the pipeline config's disease_score_step section."""
+    return connection_matrices_step(original_data_dir, shuffled_dfs, step_config['OUTPUT_BASE_DIR'], experiment_name,
+                                    shuffle_iterations, step_config.get('MATRIX_FORMAT', 'csv'), step_config.get('MAX_WORKERS'))
+
+
 if __name__ == '__main__':
     # Default configuration for direct execution
     INPUT_DATA_DIR = 'data/pipelines/z_score_pipeline/exp1/'
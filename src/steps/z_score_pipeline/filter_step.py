@@ -1,13 +1,21 @@
 import pandas as pd
+import numpy as np
 import yaml
 import os
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from itertools import product
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 
-def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_path, output_path, filteration):
+
+def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_path, output_path, filteration, verbose=True):
     print("\n" + "="*70)
     print("Starting Filter Step")
     print("="*70)
@@ -17,7 +25,8 @@ def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_pat
     # Load the wanted disease codes from YAML
     print(f"\n[Step 1/5] Loading disease codes from {codes_path}...")
     with open(codes_path, 'r') as file:
-        disease_codes = yaml.safe_load(file)['codes']
+        disease_codes = yaml.load(file, Loader=SafeLoader)['codes']
+    disease_set = frozenset(disease_codes)
     print(f"  ✓ Loaded {len(disease_codes):,} disease codes")
     if len(disease_codes) <= 10:
         print(f"  ✓ Codes: {', '.join(disease_codes)}")
@@ -43,11 +52,17 @@ def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_pat
     # Filter hesin_df based on disease codes
     print(f"\n[Step 3/5] Filtering HESIN data by disease codes...")
     rows_before_filter = len(hesin_df)
+    if method in ('keep', 'drop'):
+        # Test membership once per distinct diag_icd10 value, then gather back to rows.
+        # Missing values are factorized to -1, which indexes the trailing False.
+        diag_codes, diag_uniques = pd.factorize(hesin_df['diag_icd10'])
+        unique_in_codes = pd.Series(diag_uniques, dtype=object).str.split().str[0].isin(disease_set).to_numpy(dtype=bool)
+        in_codes = np.append(unique_in_codes, False)[diag_codes]
     if method == 'keep':
-        hesin_df = hesin_df[hesin_df['diag_icd10'].str.split().str[0].isin(disease_codes)]
+        hesin_df = hesin_df[in_codes]
         print(f"  ✓ Filtering method: KEEP (only codes in the list)")
     elif method == 'drop':
-        hesin_df = hesin_df[~hesin_df['diag_icd10'].str.split().str[0].isin(disease_codes)]
+        hesin_df = hesin_df[~in_codes]
         print(f"  ✓ Filtering method: DROP (exclude codes in the list)")
     else:
         print(f"  ⚠ Warning: Unknown method '{method}', skipping disease code filtering")
@@ -60,6 +75,24 @@ def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_pat
 
     # Merge with eid_age_sex_df to get additional fields
     print(f"\n[Step 4/5] Merging HESIN data with filter data...")
+    if not (filteration is None or filteration == "None"):
+        # Push the filteration below the merge: a participant can only land in a combination
+        # if it matches one group of every field, so drop everyone else from both sides first
+        keep_mask = pd.Series(True, index=eid_age_sex_df.index)
+        for field, groups in filteration.items():
+            if field not in eid_age_sex_df.columns:
+                continue
+            field_mask = pd.Series(False, index=eid_age_sex_df.index)
+            for condition in groups.values():
+                if isinstance(condition, dict) and 'min' in condition and 'max' in condition:
+                    field_mask |= eid_age_sex_df[field].between(condition['min'], condition['max'])
+                else:
+                    field_mask |= eid_age_sex_df[field] == condition
+            keep_mask &= field_mask
+        eid_age_sex_df = eid_age_sex_df[keep_mask]
+        hesin_df = hesin_df[hesin_df['eid'].isin(eid_age_sex_df['eid'].unique())]
+        print(f"  ✓ Pre-filtered to {len(eid_age_sex_df):,} participants matching any filter combination")
+        print(f"  ✓ HESIN rows left to merge: {len(hesin_df):,}")
     merged_df = hesin_df.merge(eid_age_sex_df, on='eid', how='inner')
     print(f"  ✓ Merged dataset: {len(merged_df):,} rows")
     print(f"  ✓ Merged columns: {list(merged_df.columns)}")
@@ -103,59 +136,84 @@ def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_pat
         print(f"  ✓ Generated {len(filter_combinations):,} filter combination(s)")
         
         # Print filter details
-        print(f"  Filter configuration:")
-        for field, groups in filteration.items():
-            print(f"    - {field}:")
-            for group_name, condition in groups.items():
-                if isinstance(condition, dict) and 'min' in condition and 'max' in condition:
-                    print(f"      * {group_name}: {condition['min']} <= value <= {condition['max']}")
-                else:
-                    print(f"      * {group_name}: {condition}")
+        if verbose:
+            print(f"  Filter configuration:")
+            for field, groups in filteration.items():
+                print(f"    - {field}:")
+                for group_name, condition in groups.items():
+                    if isinstance(condition, dict) and 'min' in condition and 'max' in condition:
+                        print(f"      * {group_name}: {condition['min']} <= value <= {condition['max']}")
+                    else:
+                        print(f"      * {group_name}: {condition}")
 
-        # Apply filters and save each group
+        # Apply filters to each group and write the CSVs concurrently (the writes are I/O-bound)
         print(f"\n  Applying filters and saving results...")
         total_records_saved = 0
-        for idx, combination in enumerate(filter_combinations, 1):
-            # Create a copy of the DataFrame to apply filters
-            group_df = merged_df.copy()
-            group_name_parts = []
-            filter_details = []
+        max_workers = max(1, min(8, os.cpu_count() or 1, len(filter_combinations)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Only counts are kept per write, and at most max_workers writes are in flight,
+            # so each group DataFrame is freed as soon as its CSV has been written
+            pending_writes = deque()
 
-            # Apply each filter in the combination
-            for field, group_name, condition in combination:
-                group_name_parts.append(group_name)
-                if isinstance(condition, dict) and 'min' in condition and 'max' in condition:
-                    # Apply range filter
-                    rows_before = len(group_df)
-                    group_df = group_df[
-                        (group_df[field] >= condition['min']) &
-                        (group_df[field] <= condition['max'])
-                        ]
-                    rows_after = len(group_df)
-                    filter_details.append(f"{field} [{condition['min']}-{condition['max']}]: {rows_before:,} -> {rows_after:,} rows")
-                else:
-                    # Apply categorical filter
-                    rows_before = len(group_df)
-                    group_df = group_df[group_df[field] == condition]
-                    rows_after = len(group_df)
-                    filter_details.append(f"{field} == {condition}: {rows_before:,} -> {rows_after:,} rows")
+            def finish_write(idx, group_name, n_records, n_participants, filter_details, output_file, future):
+                nonlocal total_records_saved
+                future.result()
+                total_records_saved += n_records
+                if not verbose:
+                    return
+
+                # Format the whole per-combination report once and emit it with a single print
+                file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
+                report_lines = [f"\n  [{idx}/{len(filter_combinations)}] {group_name}:"]
+                report_lines += [f"    {label}: {before:,} -> {after:,} rows" for label, before, after in filter_details]
+                report_lines += [
+                    f"    ✓ Saved to {output_file}",
+                    f"    ✓ Records: {n_records:,}",
+                    f"    ✓ Unique participants: {n_participants:,}",
+                    f"    ✓ File size: {file_size_mb:.2f} MB",
+                ]
+                print("\n".join(report_lines))
 
-            # Create group name by joining parts
-            group_name = '_'.join(group_name_parts)
+            for idx, combination in enumerate(filter_combinations, 1):
+                group_df = merged_df
+                group_name_parts = []
+                filter_details = []
+
+                # Apply each filter in the combination
+                for field, group_name, condition in combination:
+                    group_name_parts.append(group_name)
+                    if isinstance(condition, dict) and 'min' in condition and 'max' in condition:
+                        # Apply range filter
+                        rows_before = len(group_df)
+                        group_df = group_df[
+                            (group_df[field] >= condition['min']) &
+                            (group_df[field] <= condition['max'])
+                            ]
+                        if verbose:
+                            filter_details.append((f"{field} [{condition['min']}-{condition['max']}]", rows_before, len(group_df)))
+                    else:
+                        # Apply categorical filter
+                        rows_before = len(group_df)
+                        group_df = group_df[group_df[field] == condition]
+                        if verbose:
+                            filter_details.append((f"{field} == {condition}", rows_before, len(group_df)))
 
-            # Save to CSV
-            output_file = os.path.join(output_path, f'{group_name}_filtered.csv')
-            group_df.to_csv(output_file, index=False)
-            file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
-            total_records_saved += len(group_df)
-            
-            print(f"\n  [{idx}/{len(filter_combinations)}] {group_name}:")
-            for detail in filter_details:
-                print(f"    {detail}")
-            print(f"    ✓ Saved to {output_file}")
-            print(f"    ✓ Records: {len(group_df):,}")
-            print(f"    ✓ Unique participants: {group_df['eid'].nunique():,}")
-            print(f"    ✓ File size: {file_size_mb:.2f} MB")
+                # Create group name by joining parts
+                group_name = '_'.join(group_name_parts)
+
+                # Save to CSV
+                output_file = os.path.join(output_path, f'{group_name}_filtered.csv')
+                future = executor.submit(group_df.to_csv, output_file, index=False)
+                n_participants = group_df['eid'].nunique() if verbose else None
+                pending_writes.append((idx, group_name, len(group_df), n_participants, filter_details, output_file, future))
+                del group_df
+
+                # Report in order, waiting on the oldest write once the pool is saturated
+                if len(pending_writes) >= max_workers:
+                    finish_write(*pending_writes.popleft())
+
+            while pending_writes:
+                finish_write(*pending_writes.popleft())
         
         print(f"\n  Summary:")
         print(f"    ✓ Total filter combinations processed: {len(filter_combinations):,}")
@@ -173,6 +231,13 @@ def filter_step(experiment_name, hesin_data_path, codes_path, method, filter_pat
     print("="*70 + "\n")
 
 
+def filter_step_from_config(experiment_name, step_config):
+    """Run filter_step with the settings from the pipeline config's filter_step section."""
+    return filter_step(experiment_name, step_config['HESIN_DATA_PATH'], step_config['CODES_PATH'],
+                       step_config['method'], step_config['FILTER_PATH'], step_config['OUTPUT_PATH'],
+                       step_config['filteration'], step_config.get('VERBOSE', True))
+
+
 if __name__ == "__main__":
     # Set working directory to src (script directory)
     SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -238,7 +303,7 @@ Examples:
     if use_config:
         print(f"Loading configuration from {args.config}...")
         with open(args.config, 'r') as file:
-            config = yaml.safe_load(file)
+            config = yaml.load(file, Loader=SafeLoader)
         
         # Get experiment_name from top-level config
         experiment_name = config.get('experiment_name')
@@ -256,6 +321,7 @@ Examples:
         filter_path = filter_config['FILTER_PATH']
         output_path = filter_config['OUTPUT_PATH']
         filteration = filter_config.get('filteration', None)
+        verbose = filter_config.get('VERBOSE', True)
         
         print(f"  ✓ Experiment: {experiment_name}")
         print(f"  ✓ HESIN data: {hesin_data_path}")
@@ -264,6 +330,7 @@ Examples:
         print(f"  ✓ Filter path: {filter_path}")
         print(f"  ✓ Output: {output_path}")
         print(f"  ✓ Filteration: {'None' if filteration is None else 'Configured'}")
+        print(f"  ✓ Verbose: {verbose}")
     
     else:
         # Use command-line arguments
@@ -277,6 +344,7 @@ Examples:
         method = args.method
         filter_path = args.filter_path
         output_path = args.output
+        verbose = True
         
         # Handle filteration
         if args.no_filteration:
@@ -290,7 +358,7 @@ Examples:
     
     # Run the filter step
     try:
-        filter_step(experiment_name, hesin_data_path, codes_path, method, filter_path, output_path, filteration)
+        filter_step(experiment_name, hesin_data_path, codes_path, method, filter_path, output_path, filteration, verbose)
     except Exception as e:
         print(f"\n❌ Error running filter_step: {e}", file=sys.stderr)
         sys.exit(1)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import yaml
 import os
 
@@ -29,22 +30,25 @@ print(f"  ✓ Loaded {len(code_to_name)} disease name mappings")
 # Helper functions
 # ------------------------------------------------------------------ #
 def extract_edges_from_lower_triangle(df, threshold=0.0):
-    """Extract edges from lower triangle of matrix."""
-    matrix = df.values
+    """Extract edges from lower triangle of matrix as (source_idx, target_idx, weight) arrays."""
+    matrix = df.to_numpy()
     diseases = df.index.tolist()
-    edges = []
     
-    for i in range(len(diseases)):
-        for j in range(i):  # Lower triangle: j < i
-            val = matrix[i, j]
-            if abs(val) > threshold:
-                edges.append({
-                    'source': diseases[j],
-                    'target': diseases[i],
-                    'weight': val
-                })
+    # Lower triangle: source (column) < target (row)
+    target_idx, source_idx = np.tril_indices(len(diseases), k=-1)
+    weights = matrix[target_idx, source_idx]
+    keep = np.abs(weights) > threshold
     
-    return edges, diseases
+    return (source_idx[keep].astype(np.int32), target_idx[keep].astype(np.int32),
+            weights[keep].astype(np.float32), diseases)
+
+
+def lower_triangle_abs_weights(df, threshold=0.0):
+    """Absolute lower-triangle values above threshold, read straight from the matrix."""
+    matrix = df.to_numpy()
+    rows, cols = np.tril_indices(matrix.shape[0], k=-1)
+    values = np.abs(matrix[rows, cols])
+    return values[values > threshold]
 
 
 def wrap_text(text, max_chars=15):
@@ -75,11 +79,11 @@ def create_circular_graph(df, title, code_to_name, global_min_weight, global_max
     """Create a circular network graph."""
     
     # Extract edges and nodes - only edges with values > 1
-    edges, nodes = extract_edges_from_lower_triangle(df, threshold=1.0)
+    source_idx, target_idx, weights, nodes = extract_edges_from_lower_triangle(df, threshold=1.0)
     
     print(f"\n  {title}:")
     print(f"    - Nodes: {len(nodes)}")
-    print(f"    - Edges: {len(edges)}")
+    print(f"    - Edges: {len(weights)}")
     
     # Create figure with larger size
     fig, ax = plt.subplots(figsize=(16, 16), facecolor='white')
@@ -90,35 +94,26 @@ def create_circular_graph(df, title, code_to_name, global_min_weight, global_max
     radius = 2.5  # Increased from 1.0 to 1.5 - makes the circle bigger
     
     # Position each node
-    positions = {}
-    for i, node in enumerate(nodes):
-        x = radius * np.cos(angles[i])
-        y = radius * np.sin(angles[i])
-        positions[node] = (x, y, angles[i])
-    
-    # Draw edges
-    for edge in edges:
-        source = edge['source']
-        target = edge['target']
-        weight = abs(edge['weight'])
-        
-        if source in positions and target in positions:
-            x0, y0, _ = positions[source]
-            x1, y1, _ = positions[target]
-            
-            # Scale line width based on weight
-            if global_max_weight > global_min_weight:
-                norm_weight = (weight - global_min_weight) / (global_max_weight - global_min_weight)
-                line_width = 1.5 + 8.0 * norm_weight  # Range: 0.5 to 6.0
-            else:
-                line_width = 2.0
-            
-            # Draw edge in red
-            ax.plot([x0, x1], [y0, y1], 'r-', linewidth=line_width, alpha=0.6, zorder=1)
+    xs = radius * np.cos(angles)
+    ys = radius * np.sin(angles)
+    
+    # Scale line width based on weight
+    abs_weights = np.abs(weights)
+    if global_max_weight > global_min_weight:
+        norm_weights = (abs_weights - global_min_weight) / (global_max_weight - global_min_weight)
+        line_widths = 1.5 + 8.0 * norm_weights  # Range: 0.5 to 6.0
+    else:
+        line_widths = np.full(len(abs_weights), 2.0)
+    
+    # Draw all edges in red as a single collection of (source, target) segments
+    segments = np.stack([
+        np.column_stack([xs[source_idx], ys[source_idx]]),
+        np.column_stack([xs[target_idx], ys[target_idx]]),
+    ], axis=1)
+    ax.add_collection(LineCollection(segments, colors='r', linewidths=line_widths, alpha=0.6, zorder=1))
     
     # Draw nodes
-    for node in nodes:
-        x, y, angle = positions[node]
+    for node, x, y, angle in zip(nodes, xs, ys, angles):
         
         # Draw node circle
         circle = plt.Circle((x, y), 0.06, color='steelblue', ec='darkblue', 
@@ -183,19 +178,19 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Load matrices
 print("\nLoading matrices...")
-old_df = pd.read_csv(OLD_MATRIX_PATH, index_col=0)
+old_df = pd.read_csv(OLD_MATRIX_PATH, index_col=0).astype(np.float32)
 print(f"  ✓ Old matrix shape: {old_df.shape}")
 
 # Try to load young matrix
 if os.path.exists(YOUNG_MATRIX_PATH):
-    young_df = pd.read_csv(YOUNG_MATRIX_PATH, index_col=0)
+    young_df = pd.read_csv(YOUNG_MATRIX_PATH, index_col=0).astype(np.float32)
     print(f"  ✓ Young matrix shape: {young_df.shape}")
 else:
     # Try upper as fallback
     fallback_path = YOUNG_MATRIX_PATH.replace('young_lower', 'young_upper')
     if os.path.exists(fallback_path):
         print(f"  ⚠ {YOUNG_MATRIX_PATH} not found, using: {fallback_path}")
-        young_df = pd.read_csv(fallback_path, index_col=0)
+        young_df = pd.read_csv(fallback_path, index_col=0).astype(np.float32)
         print(f"  ✓ Young matrix shape: {young_df.shape}")
     else:
         print(f"  ⚠ Error: Young matrix not found")
@@ -203,19 +198,14 @@ else:
 
 # Calculate global min/max for consistent scaling (only edges > 1)
 print("\nCalculating global weight range for edge width scaling...")
-all_weights = []
-
-if young_df is not None:
-    young_edges, _ = extract_edges_from_lower_triangle(young_df, threshold=1.0)
-    all_weights.extend([abs(e['weight']) for e in young_edges])
-
-if old_df is not None:
-    old_edges, _ = extract_edges_from_lower_triangle(old_df, threshold=1.0)
-    all_weights.extend([abs(e['weight']) for e in old_edges])
-
-if all_weights:
-    global_min_weight = min(all_weights)
-    global_max_weight = max(all_weights)
+all_weights = np.concatenate([
+    lower_triangle_abs_weights(matrix_df, threshold=1.0)
+    for matrix_df in (young_df, old_df) if matrix_df is not None
+])
+
+if all_weights.size:
+    global_min_weight = float(all_weights.min())
+    global_max_weight = float(all_weights.max())
 else:
     global_min_weight = 0.0
     global_max_weight = 1.0
@@ -1,7 +1,11 @@
 import pandas as pd
 import yaml
 import os
-from collections import OrderedDict
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 
 # Set working directory to src (script directory)
 SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -138,7 +142,7 @@ print(f"   ✓ Found {len(all_mappings)} code mappings in tree YAML")
 
 # Create mapping for codes we need
 print("\n4. Creating mapping for codes in CSV files...")
-disease_mapping = OrderedDict()
+disease_mapping = {}
 
 for code in all_codes:
     # First try to find exact match
@@ -159,11 +163,8 @@ for code in all_codes:
 print(f"\n5. Saving mapping to: {OUTPUT_YAML_PATH}")
 os.makedirs(os.path.dirname(OUTPUT_YAML_PATH), exist_ok=True)
 
-# Convert OrderedDict to regular dict for cleaner YAML output
-disease_mapping_dict = dict(disease_mapping)
-
 with open(OUTPUT_YAML_PATH, 'w') as file:
-    yaml.dump(disease_mapping_dict, file, default_flow_style=False, sort_keys=False, allow_unicode=True)
+    yaml.dump(disease_mapping, file, Dumper=SafeDumper, default_flow_style=False, sort_keys=False, allow_unicode=True)
 
 print(f"   ✓ Successfully saved {len(disease_mapping)} mappings")
 
@@ -2,6 +2,7 @@ import yaml
 import csv
 import re
 import os
+from bisect import bisect_left, bisect_right
 
 def read_yaml_file(yaml_file_path):
     with open(yaml_file_path, 'r') as file:
@@ -9,25 +10,41 @@ def read_yaml_file(yaml_file_path):
 
 def read_tsv_file(tsv_file_path):
     tsv_data = {}
-    with open(tsv_file_path, 'r') as file:
-        reader = csv.DictReader(file, delimiter='\t')
+    with open(tsv_file_path, 'r', newline='') as file:
+        reader = csv.reader(file, delimiter='\t')
+        header = next(reader)
+        coding_idx = header.index('coding')
+        meaning_idx = header.index('meaning')
+        min_len = max(coding_idx, meaning_idx) + 1
         for row in reader:
-            code = row['coding']
-            meaning = row['meaning']
+            # Skip blank and short rows (DictReader skipped blank lines too)
+            if len(row) < min_len:
+                continue
+            code = row[coding_idx]
+            meaning = row[meaning_idx]
             # Normalize code to standard format (e.g., A000 -> A00.0)
-            normalized_code = code
             if len(code) > 3 and code[0].isalpha() and code[1:].isdigit():
                 normalized_code = f"{code[0]}{code[1:3]}.{code[3:]}"
+                parent = code[:3]
+            else:
+                normalized_code = code
+                parent = code.partition('.')[0]
             # Group by the parent category (e.g., A00 for A00.0, A00.1)
-            parent = normalized_code.split('.')[0] if '.' in normalized_code else normalized_code
-            if parent not in tsv_data:
-                tsv_data[parent] = []
-            tsv_data[parent].append((normalized_code, meaning))
+            tsv_data.setdefault(parent, []).append((normalized_code, meaning))
     return tsv_data
 
 def merge_yaml_tsv(yaml_data, tsv_data):
     result = {'CategoryCount': {}}
 
+    # Index the TSV parents once: sorted for range lookups, with their TSV order kept for output,
+    # and the main code entry (the one without a dot) for each parent
+    parents_sorted = sorted(tsv_data)
+    parent_order = {parent: idx for idx, parent in enumerate(tsv_data)}
+    main_entries = {
+        parent: next((entry for entry in entries if '.' not in entry[0]), None)
+        for parent, entries in tsv_data.items()
+    }
+
     # Iterate through each chapter in the YAML file
     for chapter, chapter_data in yaml_data['CategoryCount'].items():
         result['CategoryCount'][chapter] = {
@@ -45,11 +62,11 @@ def merge_yaml_tsv(yaml_data, tsv_data):
 
             # Split the range (e.g., A00-A09, G00-G09) to find matching TSV entries
             start, end = subcategory_code.split('-')
-            for code in tsv_data:
+            codes_in_range = parents_sorted[bisect_left(parents_sorted, start):bisect_right(parents_sorted, end)]
+            for code in sorted(codes_in_range, key=parent_order.get):
                 # Check if the code falls within the range (e.g., A00 or G00 is in A00-A09 or G00-G09)
-                if code.startswith(start[0]) and start <= code <= end:
-                    # Find the main code entry in tsv_data (the one without a dot)
-                    main_entry = next((entry for entry in tsv_data[code] if '.' not in entry[0]), None)
+                if code.startswith(start[0]):
+                    main_entry = main_entries[code]
                     # Use the meaning without the code prefix, or fall back to YAML title
                     title = main_entry[1].split(' ', 1)[1] if main_entry and ' ' in main_entry[1] else main_entry[1] if main_entry else subcategory_title
                     result['CategoryCount'][chapter]['subcategories'][subcategory_code]['subcategories'][code] = {
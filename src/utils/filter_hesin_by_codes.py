@@ -4,10 +4,6 @@ from pathlib import Path
 
 import pandas as pd
 import yaml
-from tqdm import tqdm
-
-# Enable tqdm for pandas
-tqdm.pandas()
 
 # Path definitions
 DATA_HESIN_DIR = Path("/Users/galle/PycharmProjects/UK-Biobank-Project/src/data/data_hesin")
@@ -16,6 +12,9 @@ DEFAULT_DATA_PATH = DATA_HESIN_DIR / "data_hesin_dates_fixed.csv"
 DEFAULT_OUTPUT_DIR = DATA_HESIN_DIR / "sub_data_hesin"
 DEFAULT_YAML_PATH = CODES_FILES_DIR / "grant_poc.yaml"
 
+# Translation table dropping the dots from a code (surrounding whitespace is stripped separately)
+CODE_STRIP_TABLE = str.maketrans("", "", ".")
+
 
 def load_codes_from_yaml(yaml_path: Path) -> list[str]:
     """
@@ -42,41 +41,23 @@ def normalize_code(code: str) -> str:
     """
     if pd.isna(code):
         return ""
-    return str(code).replace(".", "").strip().upper()
+    return str(code).translate(CODE_STRIP_TABLE).strip().upper()
 
 
-def extract_code_from_diag(diag_icd10: str) -> str:
+def extract_codes_from_diag(diag_icd10: pd.Series) -> pd.Series:
     """
-    Extract just the code from a diag_icd10 string like 'L03.1 Cellulitis of other parts of limb'.
-    Returns the normalized code (without dots).
+    Extract the normalized codes from diag_icd10 strings like 'L03.1 Cellulitis of other parts of limb'.
+    Vectorized over the whole column; missing values become ''.
     """
-    if pd.isna(diag_icd10):
-        return ""
-    # The code is the first part before the space
-    parts = str(diag_icd10).split(" ", 1)
-    code = parts[0] if parts else ""
-    return normalize_code(code)
-
-
-def code_matches(diag_code: str, filter_codes: list[str]) -> bool:
-    """
-    Check if a diagnosis code matches any of the filter codes.
-    
-    Matching rules:
-    - If filter code is a prefix (e.g., 'M85'), match any code starting with it
-    - If filter code is exact (e.g., 'M85.92'), match exactly
-    
-    Args:
-        diag_code: The normalized diagnosis code from the data
-        filter_codes: List of normalized filter codes from YAML
-        
-    Returns:
-        True if the diagnosis code matches any filter code
-    """
-    for filter_code in filter_codes:
-        if diag_code.startswith(filter_code):
-            return True
-    return False
+    # The code is the first part before the space; the nullable string cast keeps .str working
+    # on columns pandas read as all-NaN floats while leaving missing values as NA (not 'nan')
+    return (
+        diag_icd10.astype("string").str.split(" ", n=1).str[0]
+        .str.translate(CODE_STRIP_TABLE)
+        .str.strip()
+        .str.upper()
+        .fillna("")
+    )
 
 
 def filter_hesin_by_codes(
@@ -107,10 +88,12 @@ def filter_hesin_by_codes(
     print(f"Loaded {len(df)} rows")
     
     print("Extracting and normalizing diagnosis codes...")
-    df["normalized_code"] = df["diag_icd10"].progress_apply(extract_code_from_diag)
+    df["normalized_code"] = extract_codes_from_diag(df["diag_icd10"])
     
     print("Filtering rows based on codes...")
-    mask = df["normalized_code"].progress_apply(lambda x: code_matches(x, normalized_codes))
+    # A row matches when its code starts with any filter code: a prefix (e.g., 'M85')
+    # matches all of its subcodes, an exact code (e.g., 'M85.92') matches itself
+    mask = df["normalized_code"].str.startswith(tuple(normalized_codes), na=False)
     df_filtered = df[mask].drop(columns=["normalized_code"])
     
     print(f"Filtered to {len(df_filtered)} rows ({len(df_filtered) / len(df) * 100:.2f}%)")
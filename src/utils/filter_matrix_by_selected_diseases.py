@@ -1,7 +1,13 @@
+import re
 import pandas as pd
 import yaml
 import os
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # Set working directory to src (script directory)
 SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 os.chdir(SRC_DIR)
@@ -10,14 +16,15 @@ print(f"Working directory set to: {os.getcwd()}")
 # === CONFIGURATION ===
 SELECTED_DISEASES_PATH = 'data/pipelines/z_score_pipeline/codes_files/kobi_gal_session.yaml'
 MATRIX_PATH = 'data/pipelines/z_score_pipeline/grant_poc_kobi_new_list/ci_analysis/old_upper_ci_analysis.csv'
-OUTPUT_PATH = 'data/pipelines/z_score_pipeline/grant_poc_kobi_new_list/ci_analysis/old_upper_ci_analysis_kobi_gal_session.csv'
+OUTPUT_PATH = 'data/pipelines/z_score_pipeline/grant_poc_kobi_new_list/ci_analysis/old_upper_ci_analysis_kobi_gal_session.csv'  # A .parquet path writes Parquet (needs pyarrow)
+VERBOSE = True  # Print the matching codes found for each selected code
 
 # ------------------------------------------------------------------ #
 # 1. Load selected diseases
 # ------------------------------------------------------------------ #
 print(f"Loading selected diseases from: {SELECTED_DISEASES_PATH}")
 with open(SELECTED_DISEASES_PATH, 'r') as file:
-    selected_diseases_data = yaml.safe_load(file)
+    selected_diseases_data = yaml.load(file, Loader=SafeLoader)
 selected_codes = selected_diseases_data.get('codes', [])
 print(f"  ✓ Loaded {len(selected_codes)} selected codes")
 print(f"  ✓ Selected codes: {', '.join(selected_codes)}")
@@ -25,53 +32,63 @@ print(f"  ✓ Selected codes: {', '.join(selected_codes)}")
 # ------------------------------------------------------------------ #
 # 2. Load matrix
 # ------------------------------------------------------------------ #
+# One anchored alternation matches every selected code and its dotted subcodes
+pattern = '^(?:' + '|'.join(re.escape(code) for code in selected_codes) + r')(?:\.|$)'
+
 print(f"\nLoading matrix from: {MATRIX_PATH}")
-df = pd.read_csv(MATRIX_PATH, index_col=0)
-print(f"  ✓ Loaded matrix with shape: {df.shape}")
-print(f"  ✓ Matrix has {len(df.index)} rows and {len(df.columns)} columns")
+# Read the header first so that only the columns matching a selected code get parsed
+matrix_columns = pd.read_csv(MATRIX_PATH, index_col=0, nrows=0).columns
+column_matches = matrix_columns.str.match(pattern) if selected_codes else [False] * len(matrix_columns)
+usecols = [0] + [position + 1 for position, matched in enumerate(column_matches) if matched]
+df = pd.read_csv(MATRIX_PATH, index_col=0, usecols=usecols)
+original_shape = (len(df.index), len(matrix_columns))
+print(f"  ✓ Loaded matrix with shape: {original_shape}")
+print(f"  ✓ Matrix has {len(df.index)} rows and {len(matrix_columns)} columns ({len(df.columns)} columns parsed)")
 
 # Get all codes in the matrix (both rows and columns should be the same)
-matrix_codes = set(df.index) | set(df.columns)
+# The row and column sets are built once and reused for the availability check below
+row_codes = set(df.index)
+column_codes = set(matrix_columns)
+matrix_codes = row_codes | column_codes
 print(f"  ✓ Unique codes in matrix: {len(matrix_codes)}")
 
 # ------------------------------------------------------------------ #
 # 3. Find matching codes (including subcodes)
 # ------------------------------------------------------------------ #
 print(f"\nFinding matching codes (including subcodes)...")
-codes_to_keep = set()
 
-for selected_code in selected_codes:
-    matching_codes = []
-    
-    # Check for exact match
-    if selected_code in matrix_codes:
-        matching_codes.append(selected_code)
-        codes_to_keep.add(selected_code)
-    
-    # Find all subcodes (codes that start with selected_code followed by a dot)
-    prefix = selected_code + '.'
-    for code in matrix_codes:
-        if code.startswith(prefix):
-            matching_codes.append(code)
-            codes_to_keep.add(code)
+# Match all codes against the alternation in a single vectorized pass
+sorted_index = pd.Index(sorted(matrix_codes), dtype=object)
+codes_to_keep = sorted_index[sorted_index.str.match(pattern)].tolist() if selected_codes else []
+
+if VERBOSE:
+    # Attribute each kept code to the selected codes the pattern matched it on:
+    # the code itself and each of its prefixes that ends right before a '.'
+    matches_by_selected = {selected_code: [] for selected_code in selected_codes}
+    for code in codes_to_keep:
+        prefixes = [code] + [code[:position] for position, char in enumerate(code) if char == '.']
+        for prefix in prefixes:
+            if prefix in matches_by_selected:
+                matches_by_selected[prefix].append(code)
     
-    if matching_codes:
-        print(f"  ✓ {selected_code}: Found {len(matching_codes)} code(s) - {', '.join(sorted(matching_codes)[:10])}{'...' if len(matching_codes) > 10 else ''}")
-    else:
-        print(f"  ⚠ {selected_code}: No matching codes found in matrix")
+    for selected_code in selected_codes:
+        matching_codes = matches_by_selected[selected_code]
+        if matching_codes:
+            print(f"  ✓ {selected_code}: Found {len(matching_codes)} code(s) - {', '.join(matching_codes[:10])}{'...' if len(matching_codes) > 10 else ''}")
+        else:
+            print(f"  ⚠ {selected_code}: No matching codes found in matrix")
 
-codes_to_keep = sorted(list(codes_to_keep))
 print(f"\n  ✓ Total codes to keep: {len(codes_to_keep)}")
 
 # ------------------------------------------------------------------ #
 # 4. Filter matrix to keep only selected codes
 # ------------------------------------------------------------------ #
 print(f"\nFiltering matrix...")
-print(f"  Original matrix shape: {df.shape}")
+print(f"  Original matrix shape: {original_shape}")
 
 # Filter rows and columns to keep only codes_to_keep
-# Keep only codes that exist in both index and columns
-available_codes = sorted(list(set(codes_to_keep) & set(df.index) & set(df.columns)))
+# Keep only codes that exist in both index and columns (codes_to_keep is already sorted)
+available_codes = [code for code in codes_to_keep if code in row_codes and code in column_codes]
 print(f"  Codes available in both rows and columns: {len(available_codes)}")
 
 if len(available_codes) == 0:
@@ -85,7 +102,10 @@ print(f"  Filtered matrix shape: {filtered_df.shape}")
 # ------------------------------------------------------------------ #
 print(f"\nSaving filtered matrix to: {OUTPUT_PATH}")
 os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-filtered_df.to_csv(OUTPUT_PATH)
+if OUTPUT_PATH.endswith('.parquet'):
+    filtered_df.to_parquet(OUTPUT_PATH, compression='zstd')
+else:
+    filtered_df.to_csv(OUTPUT_PATH)
 print(f"  ✓ Successfully saved filtered matrix")
 
 # ------------------------------------------------------------------ #
@@ -98,7 +118,7 @@ print(f"  - Selected codes: {len(selected_codes)}")
 print(f"  - Total codes in original matrix: {len(matrix_codes)}")
 print(f"  - Codes to keep (including subcodes): {len(codes_to_keep)}")
 print(f"  - Codes available in matrix: {len(available_codes)}")
-print(f"  - Original matrix shape: {df.shape}")
+print(f"  - Original matrix shape: {original_shape}")
 print(f"  - Filtered matrix shape: {filtered_df.shape}")
 print(f"  - Output file: {OUTPUT_PATH}")
 print("="*70 + "\n")
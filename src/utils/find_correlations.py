@@ -1,3 +1,5 @@
+import heapq
+import numpy as np
 import pandas as pd
 import yaml
 import sys
@@ -8,6 +10,12 @@ SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 os.chdir(SRC_DIR)
 print(f"Working directory set to: {os.getcwd()}")
 
+# Import the shared YAML loader the way data_retriever.py does, with src on the path,
+# so the script works whatever the caller's working directory or sys.path
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+from utils.retriever_helper import load_yaml_cached
+
 # --- Configuration ---
 YAML_FILE = 'data/disease_tree_plot/output/tree_yaml.yaml'
 CSV_FILE = 'data/pipelines/z_score_pipeline/grant_poc_kobi_new_list/ci_analysis/old_upper_ci_analysis.csv'
@@ -54,9 +62,8 @@ def load_code_name_map(yaml_file):
     print(f"Loading disease names from {yaml_file}...")
     code_to_name = {}
     try:
-        with open(yaml_file, 'r', encoding='utf-8') as f:
-            yaml_data = yaml.safe_load(f)
-            parse_yaml_codes(yaml_data, code_to_name)
+        yaml_data = load_yaml_cached(yaml_file)
+        parse_yaml_codes(yaml_data, code_to_name)
         print(f"Successfully loaded {len(code_to_name)} disease codes.")
         return code_to_name
     except FileNotFoundError:
@@ -67,12 +74,47 @@ def load_code_name_map(yaml_file):
         print(f"Error loading or parsing YAML file: {e}")
         sys.exit(1)
 
-def get_disease_category(code):
-    """Get the category of a disease based on its ICD-10 code prefix."""
-    if not code:
-        return 'Unknown'
-    prefix = code[0]
-    return DISEASE_CATEGORIES.get(prefix, 'Other')
+def load_matrix(csv_file):
+    """
+    Loads a matrix CSV as float64 through a NumPy sidecar ('<file>.npz') holding the
+    values and labels, so repeated runs skip CSV parsing. The sidecar records the CSV's
+    size and mtime and is rebuilt when either differs; it is read with allow_pickle=False,
+    so it can only ever contain plain arrays.
+    Scores stay in float64 so the MIN_CORRELATION_SCORE cut is exact at the boundary.
+    """
+    cache_file = csv_file + '.npz'
+    csv_stat = os.stat(csv_file)
+    csv_signature = np.array([csv_stat.st_size, csv_stat.st_mtime_ns], dtype=np.int64)
+    try:
+        with np.load(cache_file, allow_pickle=False) as cache:
+            if np.array_equal(cache['signature'], csv_signature):
+                return pd.DataFrame(cache['values'], index=pd.Index(cache['index'].tolist()),
+                                    columns=pd.Index(cache['columns'].tolist()))
+    except (OSError, ValueError, KeyError):
+        pass  # Missing, unreadable or foreign cache: rebuild it from the CSV
+
+    # Type only the value columns (the index column holds the codes)
+    columns = pd.read_csv(csv_file, index_col=0, nrows=0).columns
+    df = pd.read_csv(csv_file, index_col=0, dtype=dict.fromkeys(columns, np.float64))
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, signature=csv_signature, values=df.to_numpy(),
+                     index=df.index.to_numpy(dtype=str), columns=df.columns.to_numpy(dtype=str))
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        # Cache is best-effort
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+    return df
+
+def get_disease_categories(codes):
+    """Get the categories of an Index of ICD-10 codes from their prefixes, as an array ('Unknown' for empty codes)."""
+    categories = codes.str[0].map(DISEASE_CATEGORIES).fillna('Other').to_numpy(dtype=object)
+    categories[codes.str.len() == 0] = 'Unknown'
+    return categories
 
 
 def find_interesting_diseases(csv_file, code_to_name):
@@ -81,7 +123,7 @@ def find_interesting_diseases(csv_file, code_to_name):
     """
     print(f"Loading correlation data from {csv_file}...")
     try:
-        df = pd.read_csv(csv_file, index_col=0)
+        df = load_matrix(csv_file)
     except FileNotFoundError:
         print(f"Error: The file {csv_file} was not found.")
         sys.exit(1)
@@ -91,29 +133,30 @@ def find_interesting_diseases(csv_file, code_to_name):
 
     print("Analyzing correlations...")
     
-    # Ensure data is numeric
-    df = df.apply(pd.to_numeric, errors='coerce')
-    
-    # Get upper triangle to avoid duplicates
-    import numpy as np
-    mask = np.triu(np.ones_like(df, dtype=bool), k=1)
-    upper_triangle = df.where(mask)
+    # Get upper triangle to avoid duplicates (on the raw array, without a NaN-filled copy)
+    values = df.to_numpy()
+    rows, cols = np.triu_indices(values.shape[0], k=1, m=values.shape[1])
+    scores = values[rows, cols]
     
     # Find all pairs with correlation >= MIN_CORRELATION_SCORE
-    high_corr_pairs = upper_triangle.stack()
-    high_corr_pairs = high_corr_pairs[high_corr_pairs >= MIN_CORRELATION_SCORE]
-    high_corr_pairs = high_corr_pairs.sort_values(ascending=False)
+    keep = scores >= MIN_CORRELATION_SCORE
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+    
+    print(f"  ✓ Found {len(scores)} pairs with correlation >= {MIN_CORRELATION_SCORE}")
     
-    print(f"  ✓ Found {len(high_corr_pairs)} pairs with correlation >= {MIN_CORRELATION_SCORE}")
+    # Filter to only keep pairs where BOTH diseases are in interesting categories (not "Other").
+    # Categories are computed once per code, then applied to all pairs as array lookups
+    row_categories = get_disease_categories(df.index)
+    col_categories = get_disease_categories(df.columns)
+    interesting = (row_categories[rows] != 'Other') & (col_categories[cols] != 'Other')
+    code_categories = dict(zip(df.columns, col_categories))
+    code_categories.update(zip(df.index, row_categories))
+    rows, cols, scores = rows[interesting], cols[interesting], scores[interesting]
     
-    # Filter to only keep pairs where BOTH diseases are in interesting categories (not "Other")
-    interesting_pairs = {}
-    for (code1, code2), score in high_corr_pairs.items():
-        cat1 = get_disease_category(code1)
-        cat2 = get_disease_category(code2)
-        # Keep if both diseases are in DISEASE_CATEGORIES (not "Other")
-        if cat1 != 'Other' and cat2 != 'Other':
-            interesting_pairs[(code1, code2)] = score
+    # Pairs stay in matrix order: nothing below needs the whole list sorted by score
+    row_codes = df.index.to_numpy()[rows]
+    col_codes = df.columns.to_numpy()[cols]
+    interesting_pairs = dict(zip(zip(row_codes, col_codes), scores))
     
     print(f"  ✓ Found {len(interesting_pairs)} pairs between interesting disease categories")
     
@@ -121,18 +164,30 @@ def find_interesting_diseases(csv_file, code_to_name):
         print("No interesting correlations found. Try lowering MIN_CORRELATION_SCORE.")
         return []
     
-    # Count how many correlations each disease has (with other interesting diseases)
-    disease_scores = {}
-    disease_connections = {}
+    # Count how many correlations each disease has (with other interesting diseases).
+    # Each pair contributes to both of its diseases, so the two code columns are
+    # stacked, mapped to integer ids and reduced with np.bincount
+    n_pairs = len(scores)
+    pair_ids, disease_codes = pd.factorize(np.concatenate([row_codes, col_codes]))
+    pair_scores = np.concatenate([scores, scores])
+    n_diseases = len(disease_codes)
+    total_scores = np.bincount(pair_ids, weights=pair_scores, minlength=n_diseases)
+    connection_counts = np.bincount(pair_ids, minlength=n_diseases)
     
-    for (code1, code2), score in interesting_pairs.items():
-        # Track total correlation score for each disease
-        disease_scores[code1] = disease_scores.get(code1, 0) + score
-        disease_scores[code2] = disease_scores.get(code2, 0) + score
-        
-        # Track number of connections
-        disease_connections[code1] = disease_connections.get(code1, 0) + 1
-        disease_connections[code2] = disease_connections.get(code2, 0) + 1
+    # List diseases in the order they would first appear in the pairs sorted by descending
+    # score (ties between equally connected diseases are broken by this order below):
+    # by their strongest pair, then by where that pair comes first in matrix order
+    strongest = np.full(n_diseases, -np.inf)
+    np.maximum.at(strongest, pair_ids, pair_scores)
+    is_strongest = pair_scores == strongest[pair_ids]
+    pair_positions = np.concatenate([np.arange(n_pairs) * 2, np.arange(n_pairs) * 2 + 1])
+    first_position = np.full(n_diseases, 2 * n_pairs)
+    np.minimum.at(first_position, pair_ids[is_strongest], pair_positions[is_strongest])
+    disease_order = np.lexsort((first_position, -strongest))
+    
+    ordered_codes = disease_codes[disease_order].tolist()
+    disease_scores = dict(zip(ordered_codes, total_scores[disease_order].tolist()))
+    disease_connections = dict(zip(ordered_codes, connection_counts[disease_order].tolist()))
     
     # Sort diseases by their total correlation score
     sorted_diseases = sorted(disease_scores.items(), key=lambda x: x[1], reverse=True)
@@ -164,10 +219,20 @@ def find_interesting_diseases(csv_file, code_to_name):
         reverse=True
     )
     
+    # Candidates are kept in a lazy max-heap keyed by their score against the selected set.
+    # A score only changes when one of the candidate's neighbours is selected, so only those
+    # neighbours are re-scored and re-pushed; outdated entries are skipped when popped.
+    # Ties go to the candidate listed first in disease_connections, as before.
+    rank = {code: i for i, code in enumerate(disease_connections)}
+    connections_to_selected = {}
+    total_score_to_selected = {}
+    candidate_heap = []
+    newly_selected = None
+    
     # Start with the most connected disease
     if sorted_by_connections:
         seed_code = sorted_by_connections[0][0]
-        category = get_disease_category(seed_code)
+        category = code_categories[seed_code]
         selected_codes.add(seed_code)
         selected_diseases.append({
             'code': seed_code,
@@ -177,58 +242,53 @@ def find_interesting_diseases(csv_file, code_to_name):
             'connections': disease_connections[seed_code]
         })
         category_counts[category] = 1
+        newly_selected = seed_code
         print(f"  Seed disease: {seed_code} ({disease_connections[seed_code]} connections)")
     
     # Iteratively add diseases that connect to the selected set
     while len(selected_diseases) < TARGET_DISEASES_COUNT:
-        best_candidate = None
-        best_score = -1
-        
-        # Find the best candidate: disease with most connections to selected diseases
-        for code in disease_connections.keys():
+        # Update the candidates connected to the disease selected last
+        for code, score in adjacency.get(newly_selected, {}).items():
             if code in selected_codes:
                 continue
+            connections_to_selected[code] = connections_to_selected.get(code, 0) + 1
+            total_score_to_selected[code] = total_score_to_selected.get(code, 0) + score
+            
+            # Score = number of connections + total correlation score
+            candidate_score = connections_to_selected[code] * 10 + total_score_to_selected[code]
+            heapq.heappush(candidate_heap, (-candidate_score, rank[code], connections_to_selected[code], code))
+        
+        # Find the best candidate: disease with most connections to selected diseases
+        best_candidate = None
+        while candidate_heap:
+            _, _, connections, code = heapq.heappop(candidate_heap)
+            if code in selected_codes or connections != connections_to_selected[code]:
+                continue  # Outdated entry
             
-            category = get_disease_category(code)
+            category = code_categories[code]
             
             # Check category balance (max 15 per category to allow up to ~135 total)
-            # This allows for 100 diseases target while maintaining some balance
+            # This allows for 100 diseases target while maintaining some balance.
+            # Counts only grow, so a candidate from a full category can be dropped for good
             if category_counts.get(category, 0) >= 15:
                 continue
             
-            # Count connections to already-selected diseases
-            connections_to_selected = 0
-            total_score_to_selected = 0
-            
-            if code in adjacency:
-                for selected_code in selected_codes:
-                    if selected_code in adjacency[code]:
-                        connections_to_selected += 1
-                        total_score_to_selected += adjacency[code][selected_code]
-            
-            # Skip if no connections to selected diseases
-            if connections_to_selected == 0:
-                continue
-            
-            # Score = number of connections + total correlation score
-            candidate_score = connections_to_selected * 10 + total_score_to_selected
-            
-            if candidate_score > best_score:
-                best_score = candidate_score
-                best_candidate = {
-                    'code': code,
-                    'name': code_to_name.get(code, code),
-                    'category': category,
-                    'total_score': disease_scores[code],
-                    'connections': disease_connections[code],
-                    'connections_to_selected': connections_to_selected
-                }
+            best_candidate = {
+                'code': code,
+                'name': code_to_name.get(code, code),
+                'category': category,
+                'total_score': disease_scores[code],
+                'connections': disease_connections[code],
+                'connections_to_selected': connections
+            }
+            break
         
         # If we found a candidate, add it
         if best_candidate:
             selected_codes.add(best_candidate['code'])
             selected_diseases.append(best_candidate)
             category_counts[best_candidate['category']] = category_counts.get(best_candidate['category'], 0) + 1
+            newly_selected = best_candidate['code']
         else:
             # No more candidates with connections, break
             print(f"  No more well-connected candidates found. Stopping at {len(selected_diseases)} diseases.")
@@ -259,8 +319,8 @@ def find_interesting_diseases(csv_file, code_to_name):
     between_correlations = []
     for (code1, code2), score in interesting_pairs.items():
         if code1 in selected_codes_list and code2 in selected_codes_list:
-            cat1 = get_disease_category(code1)
-            cat2 = get_disease_category(code2)
+            cat1 = code_categories[code1]
+            cat2 = code_categories[code2]
             between_correlations.append({
                 'code1': code1,
                 'name1': code_to_name.get(code1, code1),
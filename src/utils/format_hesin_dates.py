@@ -10,27 +10,23 @@ import pandas as pd
 from pathlib import Path
 
 
-def normalize_icd10_code(code: str) -> str:
+def normalize_icd10_codes(codes: pd.Series) -> pd.Series:
     """
-    Normalize ICD10 code by removing dots for comparison.
-    E.g., 'L03.1' -> 'L031', 'L729' -> 'L729'
+    Normalize ICD10 codes by removing dots for comparison (vectorized).
+    E.g., 'L03.1' -> 'L031', 'L729' -> 'L729'. Missing codes become "".
     """
-    if pd.isna(code):
-        return ""
-    return str(code).replace(".", "").strip()
+    normalized = codes.astype(str).str.replace(".", "", regex=False).str.strip()
+    return normalized.where(codes.notna(), "")
 
 
-def extract_code_from_description(diag_icd10_with_desc: str) -> str:
+def extract_codes_from_descriptions(diag_icd10_with_desc: pd.Series) -> pd.Series:
     """
-    Extract just the code from a description like 'L03.1 Cellulitis of other parts of limb'.
-    Returns the code without dots for matching purposes.
+    Extract just the code from descriptions like 'L03.1 Cellulitis of other parts of limb'.
+    Returns the codes without dots for matching purposes (vectorized).
     """
-    if pd.isna(diag_icd10_with_desc):
-        return ""
     # The code is the first part before the space
-    parts = str(diag_icd10_with_desc).split(" ", 1)
-    code = parts[0] if parts else ""
-    return normalize_icd10_code(code)
+    codes = diag_icd10_with_desc.astype(str).str.split(" ", n=1).str[0]
+    return normalize_icd10_codes(codes.where(diag_icd10_with_desc.notna()))
 
 
 def format_hesin_dates(
@@ -46,17 +42,17 @@ def format_hesin_dates(
         data_hesin_path: Path to data_hesin.csv (has code with descriptions)
         data_hesin_dates_path: Path to data_hesin_dates.csv (has codes only + dates)
         output_path: Path where the reformatted file will be saved
+                     (a '.parquet' suffix writes Parquet, anything else CSV)
     """
     print("Loading data_hesin.csv to build code-to-description mapping...")
     # Load data_hesin.csv to create a mapping from code to full description
     df_hesin = pd.read_csv(data_hesin_path)
     
     # Create a mapping from normalized code to the full diag_icd10 string (with description)
-    code_to_description = {}
-    for diag_icd10 in df_hesin["diag_icd10"].dropna().unique():
-        normalized_code = extract_code_from_description(diag_icd10)
-        if normalized_code:
-            code_to_description[normalized_code] = diag_icd10
+    descriptions = pd.Series(df_hesin["diag_icd10"].dropna().unique())
+    normalized_codes = extract_codes_from_descriptions(descriptions)
+    has_code = normalized_codes != ""
+    code_to_description = dict(zip(normalized_codes[has_code], descriptions[has_code]))
     
     print(f"Built mapping for {len(code_to_description)} unique ICD10 codes")
     
@@ -65,7 +61,7 @@ def format_hesin_dates(
     
     print("Applying code-to-description mapping...")
     # Normalize the codes in data_hesin_dates for matching
-    df_dates["normalized_code"] = df_dates["diag_icd10"].apply(normalize_icd10_code)
+    df_dates["normalized_code"] = normalize_icd10_codes(df_dates["diag_icd10"])
     
     # Map to the full description
     df_dates["diag_icd10_formatted"] = df_dates["normalized_code"].map(code_to_description)
@@ -88,7 +84,10 @@ def format_hesin_dates(
     })
     
     print(f"Saving output to {output_path}...")
-    df_output.to_csv(output_path, index=False)
+    if Path(output_path).suffix == ".parquet":
+        df_output.to_parquet(output_path, index=False, compression="zstd")
+    else:
+        df_output.to_csv(output_path, index=False)
     print(f"Done! Saved {len(df_output)} rows to {output_path}")
 
 
@@ -1,7 +1,14 @@
 import os
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 
+try:
+    import pyarrow  # noqa: F401  (only needed for pandas' multi-threaded CSV engine)
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
 # Path configuration
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BASE_DIR = os.path.dirname(SCRIPT_DIR)  # src directory
@@ -9,7 +16,7 @@ BASE_DIR = os.path.dirname(SCRIPT_DIR)  # src directory
 DATA_TYPE = "heart_data"  # Change this to work with different data types (e.g., "heart_data")
 INPUT_DIR = os.path.join(BASE_DIR, "data", "joints", DATA_TYPE, "input")
 OUTPUT_DIR = os.path.join(BASE_DIR, "data", "joints", DATA_TYPE, "output")
-OUTPUT_FILENAME = "joined_data.csv"
+OUTPUT_FILENAME = "joined_data.csv"  # A .parquet name writes Parquet (needs pyarrow)
 JOIN_KEY = "Participant ID"
 JOIN_TYPE = "inner"  # Options: 'outer', 'inner', 'left', 'right'
 
@@ -19,17 +26,78 @@ def find_participant_id_column(df, preferred_col="Participant ID"):
     # Exact match first
     if preferred_col in df.columns:
         return preferred_col
+    return _find_id_columns(df.columns, preferred_col)[0]
+
+
+def _find_id_columns(columns, preferred_col="Participant ID"):
+    """
+    Find the participant ID column and the "Participant ID" columns duplicating it, in one pass.
+    
+    Returns:
+        tuple: (ID column, other "Participant ID" columns)
+    """
+    exact_col = None
+    has_eid = False
+    id_like_cols = []
+    
+    # Classify every column in a single pass
+    for col in columns:
+        if col == preferred_col:
+            exact_col = col
+        if "Participant ID" in col:
+            id_like_cols.append(col)
+        elif col == "eid":
+            has_eid = True
+    
+    # Exact match first, then columns containing "Participant ID", then "eid"
+    if exact_col is not None:
+        id_col = exact_col
+    elif id_like_cols:
+        id_col = id_like_cols[0]
+    elif has_eid:
+        id_col = "eid"
+    else:
+        raise ValueError(f"Could not find participant ID column. Available columns: {list(columns)}")
+    
+    return id_col, [col for col in id_like_cols if col != id_col]
+
+
+def read_participant_csv(file_path, join_key):
+    """
+    Read a CSV with its participant ID column typed as an integer at parse time.
     
-    # Look for columns containing "Participant ID"
-    matching_cols = [col for col in df.columns if "Participant ID" in col]
-    if matching_cols:
-        return matching_cols[0]
+    Only the header is read first, to locate the ID column; duplicate ID columns
+    are then left out of the parse entirely. The nullable Int64 dtype keeps rows
+    with a missing ID loadable.
     
-    # Look for "eid" column
-    if "eid" in df.columns:
-        return "eid"
+    Returns:
+        tuple: (DataFrame, ID column, dropped duplicate ID columns)
+    """
+    header = pd.read_csv(file_path, nrows=0)
+    id_col, cols_to_drop = _find_id_columns(header.columns, join_key)
+    usecols = [col for col in header.columns if col not in cols_to_drop]
+    df = pd.read_csv(file_path, usecols=usecols, dtype={id_col: "Int64"}, engine=CSV_ENGINE)
+    return df, id_col, cols_to_drop
+
+
+def join_on_key(dataframes, join_key, how):
+    """
+    Join DataFrames on a shared key column in a single multi-way index join.
+    
+    Each frame is indexed by the key once and all frames are aligned together,
+    instead of folding pd.merge pairwise (which copies and re-hashes the growing
+    result at every step). Falls back to pairwise merges for 'left'/'right'
+    joins (a multi-way join would upcast the driving frame's integer columns)
+    and when frames share non-key columns, so pandas' _x/_y suffixes are kept.
+    """
+    value_columns = [col for df in dataframes for col in df.columns if col != join_key]
+    if how not in ("inner", "outer") or len(value_columns) != len(set(value_columns)):
+        return reduce(lambda left, right: pd.merge(left, right, on=join_key, how=how), dataframes)
     
-    raise ValueError(f"Could not find participant ID column. Available columns: {list(df.columns)}")
+    indexed = [df.set_index(join_key) for df in dataframes]
+    if len(indexed) == 1:
+        return indexed[0].reset_index()
+    return indexed[0].join(indexed[1:], how=how).reset_index()
 
 
 def join_csvs(input_dir, output_dir, output_filename="joined_data.csv", join_key="Participant ID", how="outer"):
@@ -39,7 +107,7 @@ def join_csvs(input_dir, output_dir, output_filename="joined_data.csv", join_key
     Args:
         input_dir: Directory containing CSV files to join
         output_dir: Directory to save the joined output
-        output_filename: Name of the output file
+        output_filename: Name of the output file ('.parquet' writes Parquet, anything else CSV)
         join_key: Column name to join on (will search for similar names if not found)
         how: Type of join ('outer', 'inner', 'left', 'right')
     
@@ -47,7 +115,13 @@ def join_csvs(input_dir, output_dir, output_filename="joined_data.csv", join_key
         DataFrame: The joined data
     """
     # Get all CSV files in the input directory
-    csv_files = [f for f in os.listdir(input_dir) if f.endswith('.csv')]
+    # (sorted by name, so the column order of the output does not depend on the filesystem)
+    with os.scandir(input_dir) as entries:
+        csv_entries = sorted(
+            (entry for entry in entries if entry.name.endswith('.csv') and entry.is_file()),
+            key=lambda entry: entry.name,
+        )
+    csv_files = [entry.name for entry in csv_entries]
     
     if not csv_files:
         raise ValueError(f"No CSV files found in {input_dir}")
@@ -56,38 +130,38 @@ def join_csvs(input_dir, output_dir, output_filename="joined_data.csv", join_key
     for f in csv_files:
         print(f"  - {f}")
     
+    # Parse all files concurrently; the CSV parsers release the GIL for most of the parse
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(csv_entries)))) as executor:
+        loaded = list(executor.map(lambda entry: read_participant_csv(entry.path, join_key), csv_entries))
+    
     dataframes = []
     
-    for csv_file in csv_files:
-        file_path = os.path.join(input_dir, csv_file)
-        df = pd.read_csv(file_path)
-        
-        # Find the participant ID column
-        id_col = find_participant_id_column(df, join_key)
+    for csv_file, (df, id_col, cols_to_drop) in zip(csv_files, loaded):
         print(f"\n{csv_file}: Using '{id_col}' as join key ({len(df)} rows)")
         
         # Rename to standard name if different
         if id_col != join_key:
             df = df.rename(columns={id_col: join_key})
         
-        # Drop duplicate participant ID columns (e.g., if there are multiple)
-        cols_to_drop = [col for col in df.columns if "Participant ID" in col and col != join_key]
+        # Duplicate participant ID columns (e.g., if there are multiple) were not read
         if cols_to_drop:
             print(f"  Dropping duplicate ID columns: {cols_to_drop}")
-            df = df.drop(columns=cols_to_drop)
         
         dataframes.append(df)
     
     # Join all dataframes
     print(f"\nJoining {len(dataframes)} dataframes using '{how}' join...")
-    joined_df = reduce(lambda left, right: pd.merge(left, right, on=join_key, how=how), dataframes)
+    joined_df = join_on_key(dataframes, join_key, how)
     
     print(f"Joined data: {len(joined_df)} rows, {len(joined_df.columns)} columns")
     
     # Save to output directory
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, output_filename)
-    joined_df.to_csv(output_path, index=False)
+    if output_filename.endswith('.parquet'):
+        joined_df.to_parquet(output_path, index=False, compression='zstd')
+    else:
+        joined_df.to_csv(output_path, index=False)
     print(f"\nSaved joined data to: {output_path}")
     
     return joined_df
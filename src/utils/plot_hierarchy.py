@@ -3,42 +3,47 @@ import plotly.graph_objects as go
 import os
 import json
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import orjson
+
+    def to_compact_json(obj):
+        """Serialize obj to compact JSON for embedding in the page's JavaScript."""
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def to_compact_json(obj):
+        """Serialize obj to compact JSON for embedding in the page's JavaScript."""
+        return json.dumps(obj, separators=(',', ':'))
+
 
 def read_yaml_file(yaml_file_path):
     """Read the YAML file."""
-    with open(yaml_file_path, 'r') as file:
-        return yaml.safe_load(file)
+    with open(yaml_file_path, 'r', encoding='utf-8') as file:
+        return yaml.load(file, Loader=SafeLoader)
 
 
 def flatten_hierarchy(data):
-    """Flatten YAML hierarchy into IDs, labels, and parents with level-specific codes."""
-    ids, labels, parents = [], [], []
-    ids.append("CategoryCount")
-    labels.append("Disease Hierarchy")
-    parents.append("")
-    for chapter, chapter_data in data.get('CategoryCount', {}).items():
-        chapter_id = chapter
-        chapter_label = chapter_data.get('title', chapter)
-        ids.append(chapter_id)
-        labels.append(chapter_label)
-        parents.append("CategoryCount")
-        for subcategory_code, subcategory_data in chapter_data.get('subcategories', {}).items():
-            subcategory_id = subcategory_code
-            subcategory_label = subcategory_data.get('title', subcategory_code)
-            ids.append(subcategory_id)
-            labels.append(subcategory_label)
-            parents.append(chapter_id)
-            for code, code_data in subcategory_data.get('subcategories', {}).items():
-                code_id = code
-                code_label = code_data.get('title', code)
-                ids.append(code_id)
-                labels.append(code_label)
-                parents.append(subcategory_code)
-                for sub_code, sub_title in code_data.get('subcategories', {}).items():
-                    sub_code_id = sub_code
-                    ids.append(sub_code_id)
-                    labels.append(sub_title)
-                    parents.append(code)
+    """Flatten YAML hierarchy into IDs, labels, and parents (pre-order, one entry per node)."""
+    ids, labels, parents = ["CategoryCount"], ["Disease Hierarchy"], [""]
+    add_id, add_label, add_parent = ids.append, labels.append, parents.append
+
+    # Iterative DFS over (parent id, code, node); children are pushed in reverse so they pop in order
+    stack = [("CategoryCount", code, node) for code, node in reversed(data.get('CategoryCount', {}).items())]
+    while stack:
+        parent, code, node = stack.pop()
+        add_id(code)
+        add_parent(parent)
+        if isinstance(node, dict):
+            add_label(node.get('title', code))
+            stack.extend((code, child_code, child)
+                         for child_code, child in reversed(node.get('subcategories', {}).items()))
+        else:
+            # Leaf codes map straight to their title
+            add_label(node)
     return ids, labels, parents
 
 
@@ -81,12 +86,18 @@ def plot_hierarchy(yaml_file_path, output_html_path):
     <script>
     document.addEventListener('DOMContentLoaded', function() {{
         var plotDiv = document.getElementsByClassName('plotly-graph-div')[0];
-        var selectionStates = {json.dumps(selection_states)};
-        var originalColors = {json.dumps(colors)};
-        var plotIds = {json.dumps(ids)};
-        var plotParents = {json.dumps(parents)};
+        var selectionStates = {to_compact_json(selection_states)};
+        var originalColors = {to_compact_json(colors)};
+        var plotIds = {to_compact_json(ids)};
+        var plotParents = {to_compact_json(parents)};
         var currentPoint = null;
 
+        // Index of each id in the trace, built once so repaints do not scan plotIds
+        var idIndex = new Map();
+        plotIds.forEach(function(id, i) {{
+            if (!idIndex.has(id)) idIndex.set(id, i);
+        }});
+
         // Build children map
         var childrenMap = {{}};
         for (var i = 0; i < plotIds.length; i++) {{
@@ -107,28 +118,19 @@ def plot_hierarchy(yaml_file_path, output_html_path):
             }}
         }}
 
+        // Leaf ids (no children), unique and sorted once
+        var leafIds = Array.from(idIndex.keys()).filter(function(id) {{
+            return !childrenMap[id] || childrenMap[id].length === 0;
+        }}).sort();
+
         // Function to get selected leaves
         function getSelectedLeaves() {{
-            var leaves = [];
-            for (var key in selectionStates) {{
-                if (selectionStates[key] === 1 && (!childrenMap[key] || childrenMap[key].length === 0)) {{
-                    leaves.push(key);
-                }}
-            }}
-            leaves.sort();
-            return leaves;
+            return leafIds.filter(function(id) {{ return selectionStates[id] === 1; }});
         }}
 
         // Function to get rejected leaves
         function getRejectedLeaves() {{
-            var leaves = [];
-            for (var key in selectionStates) {{
-                if (selectionStates[key] === 2 && (!childrenMap[key] || childrenMap[key].length === 0)) {{
-                    leaves.push(key);
-                }}
-            }}
-            leaves.sort();
-            return leaves;
+            return leafIds.filter(function(id) {{ return selectionStates[id] === 2; }});
         }}
 
         plotDiv.on('plotly_hover', function(data) {{
@@ -147,13 +149,14 @@ def plot_hierarchy(yaml_file_path, output_html_path):
                 var newState = (currentState + 1) % 3;
                 setStateRecursive(id, newState);
                 var colors = originalColors.slice();
-                for (var key in selectionStates) {{
-                    if (selectionStates[key] === 1) {{
-                        colors[plotIds.indexOf(key)] = 'rgba(144, 238, 144, 0.8)';  // Soft green for "want"
-                    }} else if (selectionStates[key] === 2) {{
-                        colors[plotIds.indexOf(key)] = 'rgba(240, 128, 128, 0.8)';  // Soft red for "don't want"
+                idIndex.forEach(function(index, key) {{
+                    var state = selectionStates[key];
+                    if (state === 1) {{
+                        colors[index] = 'rgba(144, 238, 144, 0.8)';  // Soft green for "want"
+                    }} else if (state === 2) {{
+                        colors[index] = 'rgba(240, 128, 128, 0.8)';  // Soft red for "don't want"
                     }}
-                }}
+                }});
                 Plotly.restyle(plotDiv, {{ 'marker.colors': [colors] }}, [0]);
             }}
         }});
@@ -202,11 +205,13 @@ def plot_hierarchy(yaml_file_path, output_html_path):
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
-    # Generate HTML with JavaScript
-    html_content = fig.to_html(full_html=True, include_plotlyjs='cdn')
-    html_content = html_content.replace('</body>', js_code + '</body>')
-    with open(output_html_path, 'w') as f:
-        f.write(html_content)
+    # Write the page piece by piece around the plot's <div> fragment, so the
+    # JavaScript is appended without copying the whole HTML string again
+    with open(output_html_path, 'w', encoding='utf-8') as f:
+        f.write('<!doctype html>\n<html>\n<head>\n    <meta charset="utf-8" />\n</head>\n<body>\n')
+        f.write(fig.to_html(full_html=False, include_plotlyjs='cdn'))
+        f.write(js_code)
+        f.write('</body>\n</html>\n')
 
 
 def main():
@@ -1,6 +1,15 @@
 import os
+import json
+import hashlib
 import yaml
+import numpy as np
 import pandas as pd
+from functools import lru_cache
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 def load_csv(file_path, required_columns=None):
     """Load a CSV file and return a DataFrame, handling file not found errors."""
@@ -15,27 +24,109 @@ def load_csv(file_path, required_columns=None):
         raise FileNotFoundError(f"Error: {file_path} not found. Please check the file path.")
 
 
+def load_yaml_cached(path):
+    """
+    Load a YAML file through a JSON sidecar cache ('<file>.json.cache').
+
+    The cache stores a SHA-1 of the YAML bytes and is used only when that hash still
+    matches, so any edit (or a restored older copy) forces a re-parse. Data that does
+    not survive a JSON round trip unchanged (dates, non-string keys, NaN) is never
+    cached, and the cache is written to a temp file and renamed into place so an
+    interrupted write cannot leave a truncated cache behind.
+    """
+    cache_path = path + '.json.cache'
+    with open(path, 'rb') as file:
+        raw = file.read()
+    digest = hashlib.sha1(raw).hexdigest()
+
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+        if isinstance(cached, dict) and cached.get('sha1') == digest and 'data' in cached:
+            return cached['data']
+    except (OSError, ValueError):
+        pass  # Missing or unreadable cache: rebuild it from the YAML
+
+    data = yaml.load(raw, Loader=SafeLoader)
+    try:
+        text = json.dumps({'sha1': digest, 'data': data})
+        if json.loads(text)['data'] != data:
+            return data  # JSON would change the data (e.g. int keys become strings)
+    except (TypeError, ValueError):
+        return data  # Not representable in JSON (e.g. dates)
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Read-only location: fall back to parsing the YAML every time
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return data
+
+
+@lru_cache(maxsize=8)
+def _load_disease_mapping(mapping_path, mtime):
+    return load_yaml_cached(mapping_path)
+
+
+def load_disease_mapping(mapping_path):
+    """Return the disease -> ICD10 codes mapping, re-parsed only when the file changes."""
+    return _load_disease_mapping(mapping_path, os.path.getmtime(mapping_path))
+
+
+def mask_by_unique_values(values, match_uniques):
+    """Evaluate match_uniques once per distinct value of a Series and broadcast it to the rows (NaN -> False)."""
+    codes, uniques = pd.factorize(values)
+    matched = np.asarray(match_uniques(uniques), dtype=bool)
+    return np.append(matched, False)[codes]
+
+
+def starts_with_any(values, prefixes):
+    """Vectorized str.startswith(tuple(prefixes)): one slice + set lookup per distinct prefix length."""
+    values = pd.Series(values, dtype=object)
+    prefixes_by_length = {}
+    for prefix in prefixes:
+        prefixes_by_length.setdefault(len(prefix), set()).add(prefix)
+
+    matched = np.zeros(len(values), dtype=bool)
+    for length, prefix_set in prefixes_by_length.items():
+        matched |= values.str[:length].isin(prefix_set).to_numpy()
+    return matched
+
+
 def get_disease_eids_by_type(hesin_data, disease_name, mapping_path):
     """Return set of participant IDs with specified disease based on ICD10 codes from YAML file."""
     # Load ICD10 codes from YAML file
-    with open(mapping_path, 'r') as file:
-        disease_codes = yaml.safe_load(file)
+    disease_codes = load_disease_mapping(mapping_path)
 
     # Get the list of ICD10 codes for the specified disease
     icd10_codes = disease_codes.get(disease_name, [])
+    if not icd10_codes:
+        return set()
+
+    # Match the prefixes once per distinct diagnosis instead of once per row
+    mask = mask_by_unique_values(hesin_data['diag_icd10'], lambda uniques: starts_with_any(uniques, icd10_codes))
+
+    # Return set of EIDs matching the ICD10 codes (deduplicated in C before building the set)
+    return set(pd.unique(hesin_data['eid'].to_numpy()[mask]))
+
+def is_disease_code(codes):
+    """Vectorized '^[A-Q][0-9][0-9]' test: compares the first three characters as a character array."""
+    chars = np.asarray(codes, dtype='U3').view('U1').reshape(-1, 3)
+    return ((chars[:, 0] >= 'A') & (chars[:, 0] <= 'Q') &
+            (chars[:, 1] >= '0') & (chars[:, 1] <= '9') &
+            (chars[:, 2] >= '0') & (chars[:, 2] <= '9'))
 
-    # Return set of EIDs matching the ICD10 codes
-    return set(hesin_data[
-                   hesin_data['diag_icd10'].notna() &
-                   hesin_data['diag_icd10'].str.startswith(tuple(icd10_codes))
-                   ]['eid'].unique())
 
 def get_disease_eids(hesin_data):
     """Return set of participant IDs with any disease diagnosis (ICD10 A00-Q99)."""
-    return set(hesin_data[
-        hesin_data['diag_icd10'].notna() &
-        hesin_data['diag_icd10'].str.match('^[A-Q][0-9][0-9]')
-    ]['eid'].unique())
+    mask = mask_by_unique_values(hesin_data['diag_icd10'], is_disease_code)
+    return set(pd.unique(hesin_data['eid'].to_numpy()[mask]))
 
 def get_healthy_eids(all_eids, disease_eids):
     """Return set of healthy participant IDs (no A00-Q99 diagnoses)."""
@@ -62,7 +153,7 @@ def save_output(final_df, config, output_dir):
 
     # Save config copy
     with open(yaml_output, 'w') as f:
-        yaml.safe_dump(config, f, sort_keys=False)
+        yaml.dump(config, f, Dumper=SafeDumper, sort_keys=False)
     print(f"Config saved to: {yaml_output}")
 
     print(f"Total participants in combined file: {len(final_df)}")
@@ -30,14 +30,59 @@ def generate_output_path(matrix1_path, matrix2_path):
 
 OUTPUT_PATH = generate_output_path(MATRIX_1_PATH, MATRIX_2_PATH)
 
+# Set to True to load and subtract in float32, which halves the memory traffic of the
+# subtraction and the statistics pass at the cost of precision: values keep ~7 significant
+# digits, so the saved results differ from the float64 default in the last digits.
+USE_FLOAT32 = False
+VALUE_DTYPE = np.float32 if USE_FLOAT32 else np.float64
+
+
+def matrix_statistics(values, block_bytes=1 << 20):
+    """
+    Compute min, max, mean of column means and positive/negative/zero counts in one pass.
+    
+    The matrix is walked in row blocks of about block_bytes, small enough to stay in
+    cache while every statistic is taken from them, so it is read from memory once
+    rather than once per statistic. NaN cells are skipped, matching pandas.
+    """
+    n_rows, n_cols = values.shape
+    block_rows = max(1, block_bytes // max(1, n_cols * values.itemsize))
+    minimum, maximum = np.inf, -np.inf
+    column_sums = np.zeros(n_cols)
+    column_counts = np.zeros(n_cols, dtype=np.int64)
+    positive_count = negative_count = 0
+    
+    for start in range(0, n_rows, block_rows):
+        block = values[start:start + block_rows]
+        is_valid = ~np.isnan(block)
+        if is_valid.any():
+            minimum = min(minimum, np.nanmin(block))
+            maximum = max(maximum, np.nanmax(block))
+        column_sums += np.where(is_valid, block, 0).sum(axis=0)
+        column_counts += is_valid.sum(axis=0)
+        positive_count += np.count_nonzero(block > 0)
+        negative_count += np.count_nonzero(block < 0)
+    
+    has_values = column_counts > 0
+    if not has_values.any():
+        return np.nan, np.nan, np.nan, 0, 0, 0
+    mean = (column_sums[has_values] / column_counts[has_values]).mean()
+    zero_count = int(column_counts.sum()) - positive_count - negative_count
+    return minimum, maximum, mean, positive_count, negative_count, zero_count
+
 # ------------------------------------------------------------------ #
 # 1. Load matrices
 # ------------------------------------------------------------------ #
+def load_matrix(path):
+    """Read a labelled matrix, parsing the value columns (not the label index) as VALUE_DTYPE."""
+    columns = pd.read_csv(path, index_col=0, nrows=0).columns
+    return pd.read_csv(path, index_col=0, dtype=dict.fromkeys(columns, VALUE_DTYPE))
+
 print(f"Loading matrix 1 from: {MATRIX_1_PATH}")
-df1 = pd.read_csv(MATRIX_1_PATH, index_col=0)
+df1 = load_matrix(MATRIX_1_PATH)
 
 print(f"Loading matrix 2 from: {MATRIX_2_PATH}")
-df2 = pd.read_csv(MATRIX_2_PATH, index_col=0)
+df2 = load_matrix(MATRIX_2_PATH)
 
 # ------------------------------------------------------------------ #
 # 2. Analyze and identify diseases to drop
@@ -63,6 +108,9 @@ only_in_2_cols = cols2 - cols1
 # Drop diseases that are in one matrix but not the other
 diseases_to_drop = (only_in_1_rows | only_in_1_cols | only_in_2_rows | only_in_2_cols)
 
+# The diseases both matrices keep, in a shared sorted order; the reindex below applies the drops
+common_diseases = sorted((indices1 & indices2) - diseases_to_drop)
+
 if diseases_to_drop:
     print("\n" + "="*60)
     print("IDENTIFYING DISEASES TO DROP:")
@@ -95,52 +143,46 @@ if diseases_to_drop:
                 locations.append("columns")
             print(f"  - {disease} (in {', '.join(locations)})")
     
-    # Drop diseases from both matrices
+    # Drop diseases from both matrices (applied by the single reindex below)
     print(f"\nDropping {len(diseases_to_drop)} disease(s) from both matrices...")
     
     # Drop from matrix 1 (both rows and columns)
     diseases_to_drop_from_1 = diseases_to_drop & (indices1 | cols1)
     if diseases_to_drop_from_1:
         # Drop rows
-        rows_to_drop = [d for d in diseases_to_drop_from_1 if d in df1.index]
+        rows_to_drop = diseases_to_drop_from_1 & indices1
         if rows_to_drop:
             print(f"  Dropping {len(rows_to_drop)} row(s) from matrix 1: {sorted(rows_to_drop)}")
-            df1 = df1.drop(index=rows_to_drop)
         
         # Drop columns
-        cols_to_drop = [d for d in diseases_to_drop_from_1 if d in df1.columns]
+        cols_to_drop = diseases_to_drop_from_1 & cols1
         if cols_to_drop:
             print(f"  Dropping {len(cols_to_drop)} column(s) from matrix 1: {sorted(cols_to_drop)}")
-            df1 = df1.drop(columns=cols_to_drop)
     
     # Drop from matrix 2 (both rows and columns)
     diseases_to_drop_from_2 = diseases_to_drop & (indices2 | cols2)
     if diseases_to_drop_from_2:
         # Drop rows
-        rows_to_drop = [d for d in diseases_to_drop_from_2 if d in df2.index]
+        rows_to_drop = diseases_to_drop_from_2 & indices2
         if rows_to_drop:
             print(f"  Dropping {len(rows_to_drop)} row(s) from matrix 2: {sorted(rows_to_drop)}")
-            df2 = df2.drop(index=rows_to_drop)
         
         # Drop columns
-        cols_to_drop = [d for d in diseases_to_drop_from_2 if d in df2.columns]
+        cols_to_drop = diseases_to_drop_from_2 & cols2
         if cols_to_drop:
             print(f"  Dropping {len(cols_to_drop)} column(s) from matrix 2: {sorted(cols_to_drop)}")
-            df2 = df2.drop(columns=cols_to_drop)
-    
-    # Ensure both matrices have the same diseases in the same order
-    common_diseases = sorted(set(df1.index) & set(df2.index))
-    df1 = df1.loc[common_diseases, common_diseases]
-    df2 = df2.loc[common_diseases, common_diseases]
     
     print(f"\n✓ Both matrices now have {len(common_diseases)} diseases in the same order")
 else:
     print("\n✓ Both matrices have identical diseases - no dropping needed")
-    
-    # Ensure same order
-    common_diseases = sorted(set(df1.index) & set(df2.index))
-    df1 = df1.loc[common_diseases, common_diseases]
-    df2 = df2.loc[common_diseases, common_diseases]
+
+missing_columns = set(common_diseases) - (cols1 & cols2)
+if missing_columns:
+    raise KeyError(f"Diseases present as rows but not as columns: {sorted(missing_columns)}")
+
+# Select rows and columns in one indexing pass per matrix
+df1 = df1.reindex(index=common_diseases, columns=common_diseases)
+df2 = df2.reindex(index=common_diseases, columns=common_diseases)
 
 print("\n" + "="*60)
 print(f"FINAL ALIGNED MATRIX DIMENSIONS: {df1.shape}")
@@ -152,18 +194,23 @@ print("="*60)
 # 3. Perform subtraction: matrix1 - matrix2
 # ------------------------------------------------------------------ #
 print("Performing subtraction: matrix1 - matrix2...")
-result = df1 - df2
+# Both matrices share the same labels in the same order, so subtract the raw arrays
+# (no pandas alignment) and wrap the result only for saving
+values = np.subtract(df1.to_numpy(dtype=VALUE_DTYPE), df2.to_numpy(dtype=VALUE_DTYPE))
+result = pd.DataFrame(values, index=df1.index, columns=df1.columns)
 
 # ------------------------------------------------------------------ #
 # 4. Display statistics
 # ------------------------------------------------------------------ #
+min_value, max_value, mean_value, positive_count, negative_count, zero_count = matrix_statistics(values)
+
 print("\nResult statistics:")
-print(f"  Min value: {result.min().min():.6f}")
-print(f"  Max value: {result.max().max():.6f}")
-print(f"  Mean value: {result.mean().mean():.6f}")
-print(f"  Number of positive values: {(result > 0).sum().sum()}")
-print(f"  Number of negative values: {(result < 0).sum().sum()}")
-print(f"  Number of zero values: {(result == 0).sum().sum()}")
+print(f"  Min value: {min_value:.6f}")
+print(f"  Max value: {max_value:.6f}")
+print(f"  Mean value: {mean_value:.6f}")
+print(f"  Number of positive values: {positive_count}")
+print(f"  Number of negative values: {negative_count}")
+print(f"  Number of zero values: {zero_count}")
 
 # ------------------------------------------------------------------ #
 # 5. Ensure output directory exists and save
@@ -174,6 +221,7 @@ if output_dir:
     print(f"Ensured output directory exists: {output_dir}")
 
 print(f"Saving result to: {OUTPUT_PATH}")
-result.to_csv(OUTPUT_PATH)
+# '%.9g' is enough digits to round-trip any float32 value exactly
+result.to_csv(OUTPUT_PATH, float_format='%.9g' if USE_FLOAT32 else None)
 print(f"Successfully saved result matrix to {OUTPUT_PATH}")
 